@@ -101,6 +101,16 @@ class PluginMenu(Menu):
                     command=run_split_blend_shapes,
                     top_level_path='Blend Shapes|SplitBlendShapes')
 
+            def run_transfer_vertex_order(unused):
+                from zMayaTools import transfer_vertex_order
+                reload(transfer_vertex_order)
+                transfer_vertex_order.run()
+
+            self.add_menu_item('zTransferVertexOrder_%s' % menu, label='Transfer Vertex Order', parent=submenu,
+                    annotation='Give a mesh the vertex order of another mesh with the same topology',
+                    command=run_transfer_vertex_order,
+                    top_level_path='Blend Shapes|TransferVertexOrder')
+
         self.add_rigging_tools()
         self.add_hide_output_window()
         self.add_show_shelf_menus()
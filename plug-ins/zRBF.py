@@ -42,17 +42,37 @@ class zRBF(OpenMayaMPx.MPxNode):
 
             samples = []
             outputs = []
+            sample_indices = []
             values = data_block.inputArrayValue(self.attr_value)
             for idx in xrange(values.elementCount()):
                 values.jumpToArrayElement(idx)
                 handle = values.inputValue()
                 value_input = handle.child(zRBF.attr_value_Position)
 
+                # Each sample has value_Value for outValue, followed by its value_Values
+                # for outValues.  These are all solved together as channels of one RBF.
                 value_output = handle.child(zRBF.attr_value_Value)
-                samples.append(value_input.asFloat3())
-                outputs.append(value_output.asDouble())
+                channel_data = handle.child(zRBF.attr_value_Values).data()
+                if channel_data.isNull():
+                    channel_values = []
+                else:
+                    channel_array = om.MFnDoubleArrayData(channel_data).array()
+                    channel_values = [channel_array[i] for i in xrange(channel_array.length())]
 
-            self.rbf = rbf.rbf(outputs, samples)
+                samples.append(value_input.asFloat3())
+                sample_indices.append(values.elementIndex())
+                outputs.append([value_output.asDouble()] + channel_values)
+
+            # Samples with fewer value_Values than others are padded with zeros.  This is
+            # usually a mistake, so warn about it.
+            channels = max(len(output) for output in outputs) if outputs else 1
+            short_samples = [idx for idx, output in zip(sample_indices, outputs) if len(output) < channels]
+            if short_samples:
+                log.warning('%s: value[%s].value_Values have fewer than %i values, and will be padded with zeros',
+                        self.name(), ', '.join(str(idx) for idx in short_samples), channels - 1)
+            outputs = [tuple(output + [0]*(channels - len(output))) for output in outputs]
+
+            self.rbf = rbf.rbf(outputs, samples, channels=channels)
             return
 
         if plug == self.attr_solvable:
@@ -79,7 +99,7 @@ class zRBF(OpenMayaMPx.MPxNode):
             except RuntimeError as e:
                 input_value = (0,0,0)
 
-            result = self.rbf.eval(input_value)
+            result = self.rbf.eval(input_value)[0]
 
             output_value_factor_handle = data_block.outputArrayValue(self.attr_outValueFactor)
             try:
@@ -101,6 +121,38 @@ class zRBF(OpenMayaMPx.MPxNode):
             
             return
 
+        if plug == self.attr_outValues or (plug.isElement() and plug.array() == self.attr_outValues):
+            data_block.inputValue(self.attr_update)
+
+            # outValues is every channel evaluated at the first input, so they all come from
+            # one evaluation.  Set the whole array at once.
+            input_attr_handle = data_block.outputArrayValue(self.inputAttr)
+            try:
+                input_attr_handle.jumpToElement(0)
+                input_value = input_attr_handle.inputValue().asFloat3()
+            except RuntimeError as e:
+                input_value = (0,0,0)
+
+            result = self.rbf.eval(input_value)[1:]
+
+            # As with outValue, each element is multiplied by the same element of outValueFactor.
+            output_value_factor_handle = data_block.outputArrayValue(self.attr_outValueFactor)
+            output_array_handle = data_block.outputArrayValue(self.attr_outValues)
+            builder = output_array_handle.builder()
+            for idx, value in enumerate(result):
+                try:
+                    output_value_factor_handle.jumpToElement(idx)
+                    value *= output_value_factor_handle.inputValue().asDouble()
+                except RuntimeError as e:
+                    pass
+
+                output_handle = builder.addElement(idx)
+                output_handle.setDouble(value)
+            output_array_handle.set(builder)
+            output_array_handle.setAllClean()
+            data_block.setClean(plug)
+            return
+
         return super(zRBF, self).compute(plug, data_block)
 
     @classmethod
@@ -134,6 +186,14 @@ class zRBF(OpenMayaMPx.MPxNode):
         uAttr.setUsesArrayDataBuilder(True)
         cls.addAttribute(cls.attr_outputAngleValue)
 
+        # Each element is one channel of value_Values, evaluated at the first inputValue.
+        cls.attr_outValues = nAttr.create('outValues', 'ovs', om.MFnNumericData.kDouble, 0)
+        nAttr.setArray(True)
+        nAttr.setWritable(False)
+        nAttr.setStorable(False)
+        nAttr.setUsesArrayDataBuilder(True)
+        cls.addAttribute(cls.attr_outValues)
+
         # Each output value is multiplied by its corresponding value in this array.  This is
         # just a convenience to avoid needing a bunch of multiplyDivide nodes.
         cls.attr_outValueFactor = nAttr.create('outValueFactor', 'ovf', om.MFnNumericData.kDouble, 1)
@@ -141,6 +201,7 @@ class zRBF(OpenMayaMPx.MPxNode):
         cls.addAttribute(cls.attr_outValueFactor)
         cls.attributeAffects(cls.attr_outValueFactor, cls.attr_outValue)
         cls.attributeAffects(cls.attr_outValueFactor, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_outValueFactor, cls.attr_outValues)
 
         cls.attr_update = nAttr.create('update', 'update', om.MFnNumericData.kBoolean)
         nAttr.setHidden(True)
@@ -148,11 +209,13 @@ class zRBF(OpenMayaMPx.MPxNode):
         cls.addAttribute(cls.attr_update)
         cls.attributeAffects(cls.attr_update, cls.attr_outValue)
         cls.attributeAffects(cls.attr_update, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_update, cls.attr_outValues)
 
         cls.attr_value_Position = nAttr.createPoint('value_Position', 'vp')
         cls.addAttribute(cls.attr_value_Position)
         cls.attributeAffects(cls.attr_value_Position, cls.attr_outValue)
         cls.attributeAffects(cls.attr_value_Position, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_value_Position, cls.attr_outValues)
         cls.attributeAffects(cls.attr_value_Position, cls.attr_update)
         cls.attributeAffects(cls.attr_value_Position, cls.attr_solvable)
 
@@ -160,16 +223,29 @@ class zRBF(OpenMayaMPx.MPxNode):
         cls.addAttribute(cls.attr_value_Value)
         cls.attributeAffects(cls.attr_value_Value, cls.attr_outValue)
         cls.attributeAffects(cls.attr_value_Value, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_value_Value, cls.attr_outValues)
         cls.attributeAffects(cls.attr_value_Value, cls.attr_update)
         cls.attributeAffects(cls.attr_value_Value, cls.attr_solvable)
 
+        # Values for outValues.  Each sample has one value for each element of outValues.  Samples
+        # with fewer values than the others are padded with zeros.
+        cls.attr_value_Values = tAttr.create('value_Values', 'vvs', om.MFnData.kDoubleArray)
+        cls.addAttribute(cls.attr_value_Values)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_outValue)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_outValues)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_update)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_solvable)
+
         cls.attr_value = cmpAttr.create('value', 'v')
         cmpAttr.setArray(True)
         cmpAttr.addChild(cls.attr_value_Position)
         cmpAttr.addChild(cls.attr_value_Value)
+        cmpAttr.addChild(cls.attr_value_Values)
         cls.addAttribute(cls.attr_value)
         cls.attributeAffects(cls.attr_value, cls.attr_outValue)
         cls.attributeAffects(cls.attr_value, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_value, cls.attr_outValues)
         cls.attributeAffects(cls.attr_value, cls.attr_update)
         cls.attributeAffects(cls.attr_value, cls.attr_solvable)
 
@@ -178,6 +254,7 @@ class zRBF(OpenMayaMPx.MPxNode):
         cls.addAttribute(cls.inputAttr)
         cls.attributeAffects(cls.inputAttr, cls.attr_outValue)
         cls.attributeAffects(cls.inputAttr, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.inputAttr, cls.attr_outValues)
 
     @classmethod
     def creator(cls):
@@ -0,0 +1,174 @@
+"""
+A uniform spatial hash grid for finding points within a fixed distance.
+
+This is an alternative to kdtree.ArrayKDTree for searches that only care about
+matches within a known radius, like matching vertices within a threshold.  Points
+are bucketed into cubic cells, and a query only looks at the cells around it, so
+lookups take expected constant time instead of descending a tree.
+
+That only holds while cells are sparse.  A query checks every point in the cells
+around it, so when the radius is large compared with the spacing between points, each
+query checks thousands of points, where a tree would prune almost all of them.
+radius_search picks whichever is faster for the points and radius.
+
+As with kdtree, distances are squared.
+"""
+
+import numpy as np
+
+from zMayaTools import kdtree
+
+# Large primes for hashing cell coordinates.  Cells whose hashes collide just share
+# a bucket, which adds candidates to check but doesn't affect results.
+_hash_primes = (73856093, 19349663, 83492791)
+
+# The most points in one cell before radius_search uses an ArrayKDTree instead.  With
+# 20k to 300k points on a sphere, the grid was faster up to about 25 points in the
+# largest cell, and the tree was faster from about 50 (17s against 1s at 1250).
+max_bucket_size = 32
+
+def radius_search(points, radius, indices=None, tree_cache=None, processes=0):
+    """
+    Return an object for finding the nearest point within radius of other points.
+
+    This is a HashGrid sized for radius, unless the points are dense enough that its
+    cells would be crowded, in which case it's a kdtree.ArrayKDTree.  Either way, search
+    it with query_within(points, radius).
+
+    If tree_cache is a kdtree_cache.TreeCache, trees are loaded from it if they were
+    built before, and saved to it if not.  A cached tree for the same points is used
+    without building the grid first.  Grids are cheap to build, so they aren't cached.
+
+    If processes is greater than one, trees are built with ArrayKDTree.build_parallel
+    in that many processes.
+    """
+    if tree_cache is not None:
+        tree = tree_cache.load_tree(points, indices=indices)
+        if tree is not None:
+            return tree
+
+    grid = HashGrid.for_radius(points, radius, indices=indices)
+    if grid.max_bucket_size <= max_bucket_size:
+        return grid
+    if tree_cache is not None:
+        return tree_cache.get_tree(points, indices=indices, processes=processes)
+    if processes > 1:
+        return kdtree.ArrayKDTree.build_parallel(points, indices=indices, processes=processes)
+    return kdtree.ArrayKDTree(points, indices=indices)
+
+class HashGrid(object):
+    def __init__(self, points, cell_size, indices=None):
+        """
+        Create a grid of points with the given cell size.
+
+        points is an (N, 3) array or a list of points.  If indices is given, it's
+        the index reported for each point.  Otherwise, points are identified by their
+        position in points.
+
+        Queries are cheapest when their radius is no larger than half of cell_size,
+        so only the 2x2x2 cells nearest the query need to be checked.  for_radius
+        creates a grid sized this way.
+        """
+        if cell_size <= 0:
+            raise ValueError('cell_size must be greater than 0')
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if indices is None:
+            indices = np.arange(len(points), dtype=np.int32)
+        else:
+            indices = np.asarray(indices, dtype=np.int32)
+            if len(indices) != len(points):
+                raise ValueError('indices must have one entry for each point')
+
+        self.cell_size = float(cell_size)
+
+        # Sort the points by cell hash, so each bucket is a contiguous range.
+        hashes = self._hash_cells(self._cells(points))
+        order = np.argsort(hashes, kind='mergesort')
+        self.points = points[order]
+        self.indices = indices[order]
+
+        hashes = hashes[order]
+        self.bucket_hashes, self.bucket_starts, counts = np.unique(hashes, return_index=True, return_counts=True)
+        self.bucket_ends = self.bucket_starts + counts
+
+        # The number of points in the fullest cell.  Queries take time proportional to
+        # this, since every point in a cell is checked.
+        self.max_bucket_size = int(counts.max()) if len(counts) else 0
+
+    @classmethod
+    def for_radius(cls, points, radius, indices=None):
+        """
+        Create a grid for queries with the given radius.
+        """
+        # A radius of zero only finds exact matches, which any cell size can do.
+        cell_size = radius * 2 if radius > 0 else 1.0
+        return cls(points, cell_size, indices=indices)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cells(self, points):
+        return np.floor(points / self.cell_size).astype(np.int64)
+
+    @staticmethod
+    def _hash_cells(cells):
+        # This relies on int64 multiplication wrapping around.
+        with np.errstate(over='ignore'):
+            return (cells[:, 0] * _hash_primes[0]) ^ (cells[:, 1] * _hash_primes[1]) ^ (cells[:, 2] * _hash_primes[2])
+
+    def query_within(self, points, radius):
+        """
+        Find the nearest point within radius of each of a list of points.
+
+        Only the cells that overlap the box around each query are checked.
+
+        Return (indices, distances), two (N,) arrays of the original index of the
+        nearest point and its squared distance.  Points with nothing within radius
+        have an index of -1 and an infinite distance.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        best_dist = np.full(len(points), np.inf)
+        best_pos = np.full(len(points), -1, dtype=np.int64)
+        if not len(points) or not len(self.points):
+            return np.full(len(points), -1, dtype=np.int32), best_dist
+
+        max_dist = radius * radius
+
+        # The range of cells on each axis that can hold points within radius of each query.
+        # With a radius of up to half the cell size, this is at most 2x2x2 cells.
+        lo_cells = self._cells(points - radius)
+        hi_cells = self._cells(points + radius)
+        span = int((hi_cells - lo_cells).max()) + 1
+
+        for dx in range(span):
+            for dy in range(span):
+                for dz in range(span):
+                    cells = lo_cells + (dx, dy, dz)
+                    rows = np.flatnonzero((cells <= hi_cells).all(axis=1))
+                    hashes = self._hash_cells(cells[rows])
+
+                    # Find the bucket for each query's neighboring cell, if there is one.
+                    bucket = np.searchsorted(self.bucket_hashes, hashes)
+                    bucket[bucket == len(self.bucket_hashes)] = 0
+                    found = np.flatnonzero(self.bucket_hashes[bucket] == hashes)
+                    if not len(found):
+                        continue
+                    bucket, found = bucket[found], rows[found]
+
+                    starts = self.bucket_starts[bucket]
+                    ends = self.bucket_ends[bucket]
+
+                    # Check the nth point in every bucket at once.  Buckets are usually small,
+                    # so this loop is short.
+                    for n in range(int((ends - starts).max())):
+                        has_point = starts + n < ends
+                        hit_rows = found[has_point]
+                        pos = starts[has_point] + n
+                        dist = ((self.points[pos] - points[hit_rows]) ** 2).sum(axis=1)
+                        better = (dist < best_dist[hit_rows]) & (dist <= max_dist)
+                        best_dist[hit_rows[better]] = dist[better]
+                        best_pos[hit_rows[better]] = pos[better]
+
+        indices = np.where(best_pos >= 0, self.indices[best_pos], -1).astype(np.int32)
+        return indices, best_dist
@@ -28,9 +28,17 @@ import heapq
 import itertools
 import operator
 import math
+import multiprocessing
+import struct
 from collections import deque
 from functools import wraps
 
+try:
+    import numpy as np
+except ImportError:
+    # ArrayKDTree needs numpy.  The linked KDNode tree doesn't.
+    np = None
+
 __author__ = u'Stefan Kögl <stefan@skoegl.net>'
 __version__ = '0.16'
 __website__ = 'https://github.com/stefankoegl/kdtree'
@@ -63,21 +71,25 @@ class Node(object):
                (all(not bool(c) for c, p in self.children))
 
 
+    # The traversals use explicit stacks rather than recursing through nested
+    # generators, so deep trees don't hit the recursion limit and each node
+    # is only yielded through one generator.
+
     def preorder(self):
         """ iterator for nodes: root, left, right """
 
         if not self:
             return
 
-        yield self
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
 
-        if self.left:
-            for x in self.left.preorder():
-                yield x
-
-        if self.right:
-            for x in self.right.preorder():
-                yield x
+            if node.right:
+                stack.append(node.right)
+            if node.left:
+                stack.append(node.left)
 
 
     def inorder(self):
@@ -86,15 +98,17 @@ class Node(object):
         if not self:
             return
 
-        if self.left:
-            for x in self.left.inorder():
-                yield x
+        stack = []
+        node = self
+        while stack or node:
+            # Walk down to the leftmost node not visited yet.
+            while node:
+                stack.append(node)
+                node = node.left
 
-        yield self
-
-        if self.right:
-            for x in self.right.inorder():
-                yield x
+            node = stack.pop()
+            yield node
+            node = node.right
 
 
     def postorder(self):
@@ -103,15 +117,19 @@ class Node(object):
         if not self:
             return
 
-        if self.left:
-            for x in self.left.postorder():
-                yield x
-
-        if self.right:
-            for x in self.right.postorder():
-                yield x
+        # Each entry is (node, children_done).
+        stack = [(self, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                yield node
+                continue
 
-        yield self
+            stack.append((node, True))
+            if node.right:
+                stack.append((node.right, False))
+            if node.left:
+                stack.append((node.left, False))
 
 
     @property
@@ -164,8 +182,14 @@ class Node(object):
         2
         """
 
-        min_height = int(bool(self))
-        return max([min_height] + [c.height()+1 for c, p in self.children])
+        height = int(bool(self))
+        stack = [(self, height)]
+        while stack:
+            node, depth = stack.pop()
+            height = max(height, depth)
+            stack.extend((c, depth+1) for c, p in node.children)
+
+        return height
 
 
     def get_child_pos(self, child):
@@ -444,49 +468,55 @@ class KDNode(Node):
 
 
     def _search_node(self, point, k, results, get_dist, counter):
-        if not self:
-            return
-
-        nodeDist = get_dist(self)
-
-        # Add current node to the priority queue if it closer than
-        # at least one point in the queue.
-        #
-        # If the heap is at its capacity, we need to check if the
-        # current node is closer than the current farthest node, and if
-        # so, replace it.
-        item = (-nodeDist, next(counter), self)
-        if len(results) >= k:
-            if -nodeDist > results[0][0]:
-                heapq.heapreplace(results, item)
-        else:
-            heapq.heappush(results, item)
-        # get the splitting plane
-        split_plane = self.data[self.axis]
-        # get the squared distance between the point and the splitting plane
-        # (squared since all distances are squared).
-        plane_dist = point[self.axis] - split_plane
-        plane_dist2 = plane_dist * plane_dist
-
-        # Search the side of the splitting plane that the point is in
-        if point[self.axis] < split_plane:
-            if self.left is not None:
-                self.left._search_node(point, k, results, get_dist, counter)
-        else:
-            if self.right is not None:
-                self.right._search_node(point, k, results, get_dist, counter)
-
-        # Search the other side of the splitting plane if it may contain
-        # points closer than the farthest point in the current results.
-        if -plane_dist2 > results[0][0] or len(results) < k:
-            if point[self.axis] < self.data[self.axis]:
-                if self.right is not None:
-                    self.right._search_node(point, k, results, get_dist,
-                                            counter)
+        # This uses an explicit stack instead of recursing, so deep trees
+        # don't hit the recursion limit.  Each entry is (node, plane_dist2),
+        # where plane_dist2 is the squared distance to the splitting plane
+        # for nodes on the far side of it, or None for nodes on the near side.
+        stack = [(self, None)]
+        while stack:
+            node, plane_dist2 = stack.pop()
+
+            # Search the other side of a splitting plane only if it may contain
+            # points closer than the farthest point in the current results.  The
+            # near side has been searched completely by the time this is popped.
+            if plane_dist2 is not None and len(results) >= k and \
+                    -plane_dist2 <= results[0][0]:
+                continue
+
+            if not node:
+                continue
+
+            nodeDist = get_dist(node)
+
+            # Add current node to the priority queue if it closer than
+            # at least one point in the queue.
+            #
+            # If the heap is at its capacity, we need to check if the
+            # current node is closer than the current farthest node, and if
+            # so, replace it.
+            item = (-nodeDist, next(counter), node)
+            if len(results) >= k:
+                if -nodeDist > results[0][0]:
+                    heapq.heapreplace(results, item)
             else:
-                if self.left is not None:
-                    self.left._search_node(point, k, results, get_dist,
-                                           counter)
+                heapq.heappush(results, item)
+            # get the splitting plane
+            split_plane = node.data[node.axis]
+            # get the squared distance between the point and the splitting plane
+            # (squared since all distances are squared).
+            plane_dist = point[node.axis] - split_plane
+
+            # Search the side of the splitting plane that the point is in
+            # first, by pushing it last.
+            if point[node.axis] < split_plane:
+                near, far = node.left, node.right
+            else:
+                near, far = node.right, node.left
+
+            if far is not None:
+                stack.append((far, plane_dist * plane_dist))
+            if near is not None:
+                stack.append((near, None))
 
 
     @require_axis
@@ -508,24 +538,27 @@ class KDNode(Node):
 
 
     def _search_nn_dist(self, point, dist, results, get_dist):
-        if not self:
-            return
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node:
+                continue
 
-        nodeDist = get_dist(self)
+            nodeDist = get_dist(node)
 
-        if nodeDist < dist:
-            results.append(self.data)
+            if nodeDist < dist:
+                results.append(node.data)
 
-        # get the splitting plane
-        split_plane = self.data[self.axis]
+            # get the splitting plane
+            split_plane = node.data[node.axis]
 
-        # Search the side of the splitting plane that the point is in
-        if point[self.axis] <= split_plane + dist:
-            if self.left is not None:
-                self.left._search_nn_dist(point, dist, results, get_dist)
-        if point[self.axis] >= split_plane - dist:
-            if self.right is not None:
-                self.right._search_nn_dist(point, dist, results, get_dist)
+            # Search the side of the splitting plane that the point is in
+            if point[node.axis] <= split_plane + dist:
+                if node.left is not None:
+                    stack.append(node.left)
+            if point[node.axis] >= split_plane - dist:
+                if node.right is not None:
+                    stack.append(node.right)
 
 
     @require_axis
@@ -612,18 +645,30 @@ def create(point_list=None, dimensions=None, axis=0, sel_axis=None):
     # by default cycle through the axis
     sel_axis = sel_axis or (lambda prev_axis: (prev_axis+1) % dimensions)
 
+    root = KDNode(sel_axis=sel_axis, axis=axis, dimensions=dimensions)
     if not point_list:
-        return KDNode(sel_axis=sel_axis, axis=axis, dimensions=dimensions)
+        return root
 
-    # Sort point list and choose median as pivot element
-    point_list = list(point_list)
-    point_list.sort(key=lambda point: point[axis])
-    median = len(point_list) // 2
+    # Build with an explicit stack of (node, points) instead of recursing, so
+    # large inputs don't hit the recursion limit.  Empty point lists give
+    # empty leaf nodes, as before.
+    stack = [(root, list(point_list))]
+    while stack:
+        node, points = stack.pop()
+        if not points:
+            continue
 
-    loc   = point_list[median]
-    left  = create(point_list[:median], dimensions, sel_axis(axis))
-    right = create(point_list[median + 1:], dimensions, sel_axis(axis))
-    return KDNode(loc, left, right, axis=axis, sel_axis=sel_axis, dimensions=dimensions)
+        # Sort point list and choose median as pivot element
+        points.sort(key=operator.itemgetter(node.axis))
+        median = len(points) // 2
+
+        node.data  = points[median]
+        node.left  = node.create_subnode(None)
+        node.right = node.create_subnode(None)
+        stack.append((node.left, points[:median]))
+        stack.append((node.right, points[median + 1:]))
+
+    return root
 
 
 def check_dimensionality(point_list, dimensions=None):
@@ -636,6 +681,897 @@ def check_dimensionality(point_list, dimensions=None):
 
 
 
+class ArrayKDTree(object):
+    """ A kd-tree stored in flat arrays
+
+    Unlike KDNode, which creates a Python object for every point, this keeps
+    the tree in a handful of contiguous numpy arrays:
+
+    - points: the coordinates, reordered into tree order
+    - indices: the original index of each point in the input
+    - axis and split: the splitting axis and value of each node
+
+    The tree is implicit.  The node for the range [lo, hi) is the median
+    point at mid = (lo + hi) // 2, and its children are the ranges [lo, mid)
+    and [mid + 1, hi).  All points in the left range are <= split on the
+    node's axis, and all points in the right range are >= split.
+
+    Ranges of leaf_size points or fewer aren't split any further.  They're
+    leaves, and searches scan all of their points with a single vectorized
+    distance computation.  This makes the tree much shallower than splitting
+    down to single points, so searches spend less time walking nodes in
+    Python.  See kdtree_benchmark.tune_leaf_size for choosing a leaf size.
+
+    Searches return original point indices instead of nodes.  As with KDNode,
+    distances are squared.
+    """
+
+    # The leaf size to use if none is given.  This was chosen by running
+    # kdtree_benchmark.tune_leaf_size on character mesh-sized inputs.
+    default_leaf_size = 16
+
+    def __init__(self, points, indices=None, leaf_size=None):
+        """ Creates a tree from a sequence of points
+
+        points can be any sequence of equal-length points, or an (N, dims)
+        array.  If indices is given, it's the index reported for each point.
+        Otherwise, points are identified by their position in points.
+
+        leaf_size is the largest number of points in a leaf.  If it's None,
+        default_leaf_size is used. """
+
+        self._init_arrays(points, indices, leaf_size)
+        self._build()
+
+
+    def _init_arrays(self, points, indices, leaf_size):
+        """ Set up the tree's arrays with the points in input order """
+
+        if np is None:
+            raise ImportError('ArrayKDTree requires numpy')
+
+        if leaf_size is None:
+            leaf_size = self.default_leaf_size
+        if leaf_size < 1:
+            raise ValueError('leaf_size must be greater than 0.')
+
+        points = np.array(points, dtype=np.float64)
+        if points.ndim == 1 and len(points) == 0:
+            points = points.reshape(0, 3)
+        if points.ndim != 2:
+            raise ValueError('All Points in the point_list must have the same dimensionality')
+
+        if indices is None:
+            indices = np.arange(len(points), dtype=np.int32)
+        else:
+            indices = np.array(indices, dtype=np.int32)
+            if len(indices) != len(points):
+                raise ValueError('indices must have one entry for each point')
+
+        self.points = points
+        self.indices = indices
+        self.leaf_size = leaf_size
+        self.dimensions = points.shape[1]
+        self.axis = np.zeros(len(points), dtype=np.int8)
+        self.split = np.zeros(len(points), dtype=np.float64)
+
+
+    def __len__(self):
+        return len(self.points)
+
+
+    @property
+    def nbytes(self):
+        """ The memory used by the tree's arrays, in bytes """
+        return sum(a.nbytes for a in (self.points, self.indices, self.axis, self.split))
+
+
+    # The saved file is a fixed-size header followed by the points, split,
+    # indices and axis arrays, each starting on an 8-byte boundary so they
+    # can be memory-mapped directly.
+    _file_magic = b'ZKDT'
+    _file_version = 1
+    _file_header = struct.Struct('<4sIIIQ')
+    _file_header_size = 64
+
+    def _file_layout(self, count, dimensions):
+        """ Return a list of (name, dtype, shape, offset) for each saved array """
+
+        layout = []
+        offset = self._file_header_size
+        for name, dtype, shape in (
+                ('points', np.float64, (count, dimensions)),
+                ('split', np.float64, (count,)),
+                ('indices', np.int32, (count,)),
+                ('axis', np.int8, (count,))):
+            layout.append((name, dtype, shape, offset))
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            offset += (size + 7) // 8 * 8
+        return layout
+
+
+    def save(self, path):
+        """ Save the tree to a file, which can be loaded with load """
+
+        header = self._file_header.pack(self._file_magic, self._file_version,
+                self.dimensions, self.leaf_size, len(self.points))
+        with open(path, 'wb') as f:
+            f.write(header.ljust(self._file_header_size, b'\0'))
+            for name, dtype, shape, offset in self._file_layout(len(self.points), self.dimensions):
+                f.seek(offset)
+                f.write(np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes())
+
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """ Load a tree saved with save
+
+        If mmap is true, the arrays are memory-mapped read-only instead of
+        read into memory, so loading is nearly free and pages are only read
+        as searches touch them. """
+
+        if np is None:
+            raise ImportError('ArrayKDTree requires numpy')
+
+        with open(path, 'rb') as f:
+            header = f.read(cls._file_header_size)
+        if len(header) < cls._file_header_size:
+            raise ValueError('%s is not a saved kd-tree' % path)
+
+        magic, version, dimensions, leaf_size, count = cls._file_header.unpack_from(header)
+        if magic != cls._file_magic or version != cls._file_version:
+            raise ValueError('%s is not a saved kd-tree' % path)
+
+        tree = cls.__new__(cls)
+        tree.dimensions = dimensions
+        tree.leaf_size = leaf_size
+        for name, dtype, shape, offset in tree._file_layout(count, dimensions):
+            if mmap and count:
+                # Searches index these arrays constantly, and results indexed from
+                # a memmap are memmaps too, which is slower.  A plain view of the
+                # same memory keeps the mapping without that overhead.
+                array = np.asarray(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape))
+            else:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    array = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            setattr(tree, name, array)
+
+        return tree
+
+
+    def _build(self, max_depth=None):
+        """ Build the tree, or only its top max_depth levels
+
+        Returns a list of (lo, hi) ranges that still need to be built.  This is
+        empty unless max_depth stops the build early. """
+
+        # Build the tree one level at a time.  Every range at a level is sorted on its
+        # own splitting axis by a single argsort over the whole array, so the cost per
+        # level is a few numpy calls regardless of how many nodes the level has.
+        #
+        # The coordinates are kept as separate columns while building, since gathering
+        # 1-D arrays is much faster than gathering rows.
+        count = len(self.points)
+        columns = [self.points[:, axis].copy() for axis in range(self.dimensions)]
+        indices = self.indices
+
+        # Sorting integer ranks is much faster than lexsorting (range, coordinate) pairs,
+        # and gives the same order.  The ranks are reordered along with the points.
+        ranks = []
+        for column in columns:
+            rank = np.empty(count, dtype=np.int64)
+            rank[np.argsort(column, kind='mergesort')] = np.arange(count)
+            ranks.append(rank)
+
+        # starts[i] is True if a range begins at position i.
+        starts = np.zeros(count + 1, dtype=bool)
+        starts[0] = starts[count] = True
+
+        depth = 0
+        while True:
+            bounds = np.flatnonzero(starts)
+            lo, hi = bounds[:-1], bounds[1:]
+
+            # Stop once every range is small enough to be a leaf.
+            if not len(lo) or (hi - lo).max() <= self.leaf_size:
+                break
+
+            if max_depth is not None and depth == max_depth:
+                break
+            depth += 1
+
+            # Split each range on the axis with the largest spread.  This keeps flat
+            # inputs, like vertices on a symmetry plane, from producing useless splits.
+            spread = [np.maximum.reduceat(column, lo) - np.minimum.reduceat(column, lo) for column in columns]
+            range_axis = np.argmax(spread, axis=0)
+
+            label = np.cumsum(starts[:-1]) - 1
+            point_axis = range_axis[label]
+            key = ranks[0].copy()
+            for axis in range(1, self.dimensions):
+                on_axis = point_axis == axis
+                key[on_axis] = ranks[axis][on_axis]
+            key += label * count
+
+            order = np.argsort(key)
+            columns = [column[order] for column in columns]
+            ranks = [rank[order] for rank in ranks]
+            indices = indices[order]
+
+            split = (hi - lo) > self.leaf_size
+            lo, hi, range_axis = lo[split], hi[split], range_axis[split]
+            mid = (lo + hi) // 2
+            self.axis[mid] = range_axis
+            for axis in range(self.dimensions):
+                on_axis = range_axis == axis
+                self.split[mid[on_axis]] = columns[axis][mid[on_axis]]
+
+            # The median becomes a range of its own, followed by the right half.
+            starts[mid] = True
+            starts[mid + 1] = True
+
+        self.points = np.column_stack(columns) if count else self.points
+        self.indices = indices
+
+        unbuilt = (hi - lo) > self.leaf_size
+        return list(zip(lo[unbuilt].tolist(), hi[unbuilt].tolist()))
+
+
+    @classmethod
+    def build_parallel(cls, points, indices=None, leaf_size=None, processes=None, min_subtree_size=65536):
+        """ Create a tree, building its subtrees in a process pool
+
+        The top levels of the tree are split here, then the subtrees below
+        them are built by separate processes and copied back in.  Since the
+        tree is implicit, a subtree built on its own has the same layout as
+        the same range of the full tree, so the result is identical to
+        ArrayKDTree(points, indices, leaf_size).
+
+        This is opt-in: nothing in zMayaTools calls it unless it's given a
+        process count.  processes is the number of worker processes,
+        defaulting to the number of CPUs.  Subtrees aren't split below
+        min_subtree_size points, since sending small subtrees to other
+        processes costs more than building them here.  With fewer than two
+        processes, or an input too small to split, this just builds the tree
+        directly.
+
+        Inside Maya, multiprocessing needs to be pointed at mayapy with
+        multiprocessing.set_executable before calling this, or the workers
+        will be started as new copies of Maya.
+        """
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        tree = cls.__new__(cls)
+        tree._init_arrays(points, indices, leaf_size)
+
+        # Split until there are a few subtrees for each process, so an uneven split
+        # doesn't leave processes idle.
+        count = len(tree.points)
+        max_depth = 0
+        while (1 << max_depth) < processes * 4 and (count >> (max_depth + 1)) >= min_subtree_size:
+            max_depth += 1
+
+        if processes < 2 or max_depth == 0:
+            tree._build()
+            return tree
+
+        ranges = tree._build(max_depth=max_depth)
+        tasks = [(tree.points[lo:hi], tree.indices[lo:hi], tree.leaf_size) for lo, hi in ranges]
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_build_subtree, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        for (lo, hi), subtree in zip(ranges, results):
+            tree.points[lo:hi], tree.indices[lo:hi], tree.axis[lo:hi], tree.split[lo:hi] = subtree
+
+        return tree
+
+
+    def _check_point(self, point):
+        if len(point) != self.dimensions:
+            raise ValueError('All Points in the point_list must have the same dimensionality')
+        return [float(c) for c in point]
+
+
+    def search_knn(self, point, k, eps=0, max_leaves=None):
+        """ Return the k nearest neighbors of point and their distances
+
+        The result is an ordered list of (index, distance) tuples, where index
+        is the original index of the point.  Fewer than k results are
+        returned if the tree has fewer than k points.
+
+        eps and max_leaves make the search approximate, as with query.
+        """
+
+        if k < 1:
+            raise ValueError("k must be greater than 0.")
+
+        point = self._check_point(point)
+        points, axes, splits = self.points, self.axis, self.split
+        prune_scale = self._prune_scale(eps)
+
+        # A max-heap of (-distance, position) for the best k points so far.
+        results = []
+        leaves = 0
+
+        stack = [(0, len(points), 0.0)] if len(points) else []
+        while stack:
+            lo, hi, bound = stack.pop()
+            if len(results) >= k and bound >= -results[0][0] * prune_scale:
+                continue
+
+            if hi - lo <= self.leaf_size:
+                if max_leaves is not None and leaves >= max_leaves:
+                    break
+                leaves += 1
+
+                dists = ((points[lo:hi] - point) ** 2).sum(axis=1)
+                candidates = zip(dists.tolist(), range(lo, hi))
+            else:
+                mid = (lo + hi) // 2
+                p = points[mid]
+                candidates = [(sum((p[i] - point[i]) ** 2 for i in range(self.dimensions)), mid)]
+
+            for d, pos in candidates:
+                item = (-d, pos)
+                if len(results) >= k:
+                    if item > results[0]:
+                        heapq.heapreplace(results, item)
+                else:
+                    heapq.heappush(results, item)
+
+            if hi - lo <= self.leaf_size:
+                continue
+
+            axis = axes[mid]
+            plane_dist = point[axis] - splits[mid]
+            far_bound = max(bound, plane_dist * plane_dist)
+
+            # Push the far side first, so the side containing the point is searched
+            # first and tightens the bound before the far side is checked.
+            if plane_dist < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            if far[0] < far[1]:
+                stack.append((far[0], far[1], far_bound))
+            if near[0] < near[1]:
+                stack.append((near[0], near[1], bound))
+
+        return [(int(self.indices[pos]), float(-d)) for d, pos in sorted(results, reverse=True)]
+
+
+    def search_nn(self, point, eps=0, max_leaves=None):
+        """
+        Search the nearest point to the given point
+
+        The result is an (index, distance) tuple, or None if the tree is empty.
+        """
+
+        return next(iter(self.search_knn(point, 1, eps, max_leaves)), None)
+
+
+    @staticmethod
+    def _prune_scale(eps):
+        """ Return the factor applied to the current kth-best distance when pruning
+
+        With eps > 0, a range is skipped unless it could hold a point closer
+        than 1 / (1 + eps) of the current kth-best distance.  Distances are
+        squared, so the factor is squared too. """
+
+        if eps < 0:
+            raise ValueError('eps must not be negative.')
+        return 1.0 / ((1.0 + eps) ** 2)
+
+
+    def search_nn_dist(self, point, distance):
+        """
+        Search the points which are within the given distance of point
+
+        Unlike KDNode.search_nn_dist, distance is not squared.  A list of the
+        original indices of the matching points is returned.
+        """
+
+        point = self._check_point(point)
+        points, axes, splits = self.points, self.axis, self.split
+        max_dist = distance * distance
+
+        results = []
+        stack = [(0, len(points))] if len(points) else []
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= self.leaf_size:
+                dists = ((points[lo:hi] - point) ** 2).sum(axis=1)
+                results.extend(self.indices[lo:hi][dists < max_dist].tolist())
+                continue
+
+            mid = (lo + hi) // 2
+            p = points[mid]
+            d = sum((p[i] - point[i]) ** 2 for i in range(self.dimensions))
+            if d < max_dist:
+                results.append(int(self.indices[mid]))
+
+            axis = axes[mid]
+            split = splits[mid]
+            if point[axis] <= split + distance and lo < mid:
+                stack.append((lo, mid))
+            if point[axis] >= split - distance and mid + 1 < hi:
+                stack.append((mid + 1, hi))
+
+        return results
+
+
+    @property
+    def height(self):
+        """ The number of levels in the tree, including leaves """
+        height, size = 1, len(self.points)
+        while size > self.leaf_size:
+            height += 1
+            size //= 2
+        return height
+
+
+    def query_within(self, points, radius):
+        """ Find the nearest point within radius of each of a list of points
+
+        This is the same as hash_grid.HashGrid.query_within, so either can be
+        used by code that only needs matches within a radius.  Returns
+        (indices, distances) as with query.  Points with nothing within radius
+        have an index of -1 and an infinite distance. """
+
+        indices, distances = self.query(points, max_distance=radius)
+        return indices.astype(np.int32), distances
+
+    def query(self, points, k=1, block_size=4096, eps=0, max_leaves=None, mask=None, max_distance=None):
+        """ Find the k nearest neighbors of each of a list of points
+
+        points is an (N, dims) array or a list of points.  Queries are run in
+        blocks of block_size points, with each block descending the tree
+        together, so the per-point cost is in numpy instead of Python.
+
+        Returns (indices, distances).  If k is 1, these are (N,) arrays of the
+        original index of the nearest point and its squared distance.  If k is
+        greater than 1, they're (N, k) arrays sorted by distance.  If there are
+        fewer than k points in the tree, missing results have an index of -1
+        and an infinite distance.
+
+        The search can be made approximate for speed:
+
+        - With eps > 0, each result is within (1 + eps) times the distance of
+        the true result of that rank.  (The squared distance is within
+        (1 + eps) ** 2.)
+        - With max_leaves, each query stops after scanning that many leaves.
+        There's no bound on the error, but the cost of each query is capped.
+
+        Measured by kdtree_benchmark.approximate_tradeoff with 250k points on
+        a sphere, querying points that are near but not on the surface:
+
+            eps  max_leaves  time   exact  worst distance ratio
+            0    -           1.00x  100%   1.00
+            0.5  -           0.82x  99.4%  1.47
+            1    -           0.73x  97.7%  1.88
+            2    -           0.65x  94.5%  2.83
+            0    8           0.95x  100%   1.16
+            0    2           0.73x  92.6%  11.05
+            0    1           0.41x  81.0%  19.05
+
+        Queries in a block run until the slowest one finishes, so eps gains
+        less than it would for one query at a time.  max_leaves=1 is the
+        fastest, but its errors can be large.
+
+        If mask is given, it's a boolean array indexed by original point
+        index, and only points whose entry is true are returned.  Masked out
+        points are still visited, so if the same mask is used for many
+        queries, it's faster to search a tree made with subset.
+
+        If max_distance is given, only points within that distance are
+        returned.  As with search_nn_dist, it isn't squared.  Subtrees
+        farther away than this are never visited, so a small max_distance
+        makes large k much cheaper.
+        """
+
+        if k < 1:
+            raise ValueError("k must be greater than 0.")
+
+        alive = self._mask_positions(mask) if mask is not None else None
+        indices, distances = self._query(points, k, block_size, alive=alive, eps=eps, max_leaves=max_leaves,
+                max_distance=max_distance)
+        if k == 1:
+            return indices[:, 0], distances[:, 0]
+        return indices, distances
+
+
+    def _mask_positions(self, mask):
+        """ Convert a mask by original index to a mask by tree position """
+
+        mask = np.asarray(mask, dtype=bool)
+        if len(self.indices) and self.indices.max() >= len(mask):
+            raise ValueError('mask must have an entry for every point index')
+        return mask[self.indices]
+
+
+    def subset(self, mask):
+        """ Return a new tree of only the points whose mask entry is true
+
+        mask is a boolean array indexed by original point index.  Points keep
+        their original indices in the new tree. """
+
+        alive = self._mask_positions(mask)
+        return ArrayKDTree(self.points[alive], indices=self.indices[alive], leaf_size=self.leaf_size)
+
+
+    def half_space(self, axis, value=0.0, positive=True):
+        """ Return a new tree of only the points on one side of a plane
+
+        If positive is true, this is the points with point[axis] >= value,
+        otherwise it's the points with point[axis] <= value.  For example,
+        half_space(0) is the points with X >= 0. """
+
+        coords = self.points[:, axis]
+        alive = coords >= value if positive else coords <= value
+        return ArrayKDTree(self.points[alive], indices=self.indices[alive], leaf_size=self.leaf_size)
+
+
+    def _query(self, points, k, block_size, alive=None, eps=0, max_leaves=None, max_distance=None):
+        """ Run query, always returning (N, k) arrays
+
+        If alive is given, it's a boolean array of which tree positions can
+        be returned.  Other points are skipped. """
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+
+        indices = np.full((len(points), k), -1, dtype=np.int32)
+        distances = np.full((len(points), k), np.inf)
+
+        if len(self.points):
+            for start in range(0, len(points), block_size):
+                end = min(start + block_size, len(points))
+                positions, distances[start:end] = self._query_block(points[start:end], k,
+                        alive, eps, max_leaves, max_distance)
+                found = positions >= 0
+                indices[start:end][found] = self.indices[positions[found]]
+
+        return indices, distances
+
+
+    def _query_block(self, queries, k, alive=None, eps=0, max_leaves=None, max_distance=None):
+        """ Run a kNN search for a block of queries
+
+        Every query has its own stack of (lo, hi, bound) ranges to visit.  Each
+        iteration pops one range for every query that still has work to do, so
+        the number of iterations is the number of nodes visited by the slowest
+        query, not the total. """
+
+        count = len(queries)
+        best_dist = np.full((count, k), np.inf)
+        best_pos = np.full((count, k), -1, dtype=np.int64)
+        if max_distance is not None:
+            # Start with every slot filled by a placeholder at the limit, so farther
+            # points and subtrees are ignored.  Candidates replace results that are
+            # strictly farther, so nudge the limit up to keep points exactly at it.
+            best_dist[:] = np.nextafter(float(max_distance) ** 2, np.inf)
+        prune_scale = self._prune_scale(eps)
+        leaves = np.zeros(count, dtype=np.int64)
+
+        # Each node pushes at most two ranges and pops one, so the stack never gets
+        # deeper than the tree plus one.
+        stack_size = self.height + 2
+        stack_lo = np.zeros((count, stack_size), dtype=np.int64)
+        stack_hi = np.zeros((count, stack_size), dtype=np.int64)
+        stack_bound = np.zeros((count, stack_size))
+        stack_hi[:, 0] = len(self.points)
+        depth = np.ones(count, dtype=np.int64)
+
+        while True:
+            rows = np.flatnonzero(depth)
+            if not len(rows):
+                break
+
+            depth[rows] -= 1
+            top = depth[rows]
+            lo, hi, bound = stack_lo[rows, top], stack_hi[rows, top], stack_bound[rows, top]
+
+            # Skip ranges that can't contain anything closer than what we already have.
+            live = bound < best_dist[rows, -1] * prune_scale
+            rows, lo, hi, bound = rows[live], lo[live], hi[live], bound[live]
+            if not len(rows):
+                continue
+
+            # Scan leaves.  Each leaf is padded out to leaf_size points, with the
+            # padding given an infinite distance.
+            leaf = (hi - lo) <= self.leaf_size
+            if leaf.any():
+                leaf_rows = rows[leaf]
+                positions, padding = self._leaf_positions(lo[leaf], hi[leaf])
+                dist = ((self.points[positions] - queries[leaf_rows, None, :]) ** 2).sum(axis=2)
+                dist[padding] = np.inf
+                if alive is not None:
+                    dist[~alive[positions]] = np.inf
+                self._merge_results(best_dist, best_pos, leaf_rows, positions, dist)
+
+                # Stop searching for queries that have scanned max_leaves leaves.
+                if max_leaves is not None:
+                    leaves[leaf_rows] += 1
+                    depth[leaf_rows[leaves[leaf_rows] >= max_leaves]] = 0
+
+                node = ~leaf
+                rows, lo, hi, bound = rows[node], lo[node], hi[node], bound[node]
+                if not len(rows):
+                    continue
+
+            mid = (lo + hi) // 2
+            q = queries[rows]
+            dist = ((self.points[mid] - q) ** 2).sum(axis=1)
+            if alive is not None:
+                dist[~alive[mid]] = np.inf
+            self._merge_results(best_dist, best_pos, rows, mid[:, None], dist[:, None])
+
+            plane_dist = q[np.arange(len(rows)), self.axis[mid]] - self.split[mid]
+            left = plane_dist < 0
+            near_lo, near_hi = np.where(left, lo, mid + 1), np.where(left, mid, hi)
+            far_lo, far_hi = np.where(left, mid + 1, lo), np.where(left, hi, mid)
+
+            # Push the far side first, so the near side is searched first.  Don't bother
+            # pushing it if it's already too far away.
+            far_bound = np.maximum(bound, plane_dist * plane_dist)
+            far_hi = np.where(far_bound < best_dist[rows, -1] * prune_scale, far_hi, far_lo)
+            self._push(stack_lo, stack_hi, stack_bound, depth, rows,
+                    far_lo, far_hi, far_bound)
+            self._push(stack_lo, stack_hi, stack_bound, depth, rows,
+                    near_lo, near_hi, bound)
+
+        best_dist[best_pos < 0] = np.inf
+        return best_pos, best_dist
+
+
+    @staticmethod
+    def _push(stack_lo, stack_hi, stack_bound, depth, rows, lo, hi, bound):
+        """ Push the non-empty ranges onto their rows' stacks """
+        nonempty = lo < hi
+        rows = rows[nonempty]
+        top = depth[rows]
+        stack_lo[rows, top] = lo[nonempty]
+        stack_hi[rows, top] = hi[nonempty]
+        stack_bound[rows, top] = bound[nonempty]
+        depth[rows] += 1
+
+
+    @staticmethod
+    def _merge_results(best_dist, best_pos, rows, positions, distances):
+        """ Merge candidate points into the sorted k-best lists of rows
+
+        positions and distances are (len(rows), c) arrays of candidates. """
+
+        k = best_dist.shape[1]
+        if k == 1:
+            closest = distances.argmin(axis=1)
+            dist = distances[np.arange(len(rows)), closest]
+            better = dist < best_dist[rows, 0]
+            rows = rows[better]
+            best_dist[rows, 0] = dist[better]
+            best_pos[rows, 0] = positions[np.flatnonzero(better), closest[better]]
+            return
+
+        # Only rows with a candidate better than their current kth result change.
+        better = (distances < best_dist[rows, -1:]).any(axis=1)
+        rows, positions, distances = rows[better], positions[better], distances[better]
+        if not len(rows):
+            return
+
+        all_dist = np.concatenate((best_dist[rows], distances), axis=1)
+        all_pos = np.concatenate((best_pos[rows], positions), axis=1)
+        order = np.argsort(all_dist, axis=1, kind='stable')[:, :k]
+        best_dist[rows] = np.take_along_axis(all_dist, order, axis=1)
+        best_pos[rows] = np.take_along_axis(all_pos, order, axis=1)
+
+
+    def _leaf_positions(self, lo, hi):
+        """ Return the positions of the points in each of a list of leaves
+
+        Returns (positions, padding).  positions is a (len(lo), leaf_size)
+        array, with leaves smaller than leaf_size padded with their first
+        point, and padding is True for padded entries. """
+
+        positions = lo[:, None] + np.arange(self.leaf_size)
+        padding = positions >= hi[:, None]
+        positions[padding] = lo[np.nonzero(padding)[0]]
+        return positions, padding
+
+
+
+def _build_subtree(args):
+    """ Build one subtree for ArrayKDTree.build_parallel in a worker process """
+
+    points, indices, leaf_size = args
+    tree = ArrayKDTree(points, indices=indices, leaf_size=leaf_size)
+    return tree.points, tree.indices, tree.axis, tree.split
+
+
+class DynamicKDTree(object):
+    """ A kd-tree that supports adding and removing batches of points
+
+    KDNode.add and remove work one point at a time and leave the tree
+    unbalanced, and rebalancing rebuilds the whole tree.  This instead uses
+    the logarithmic method: points are kept in a list of ArrayKDTrees whose
+    sizes are powers of two times base_size.  Adding points rebuilds only the
+    smallest levels that fit them, like carrying in a binary counter, so each
+    point is rebuilt O(log n) times in total.
+
+    Removed points are marked dead and skipped by searches.  A level is
+    rebuilt without its dead points once half of it is dead.
+
+    Every point has an index, which must be unique.  Searches return
+    indices, and points are removed by index.
+    """
+
+    def __init__(self, dimensions=3, leaf_size=None, base_size=64):
+        if np is None:
+            raise ImportError('DynamicKDTree requires numpy')
+
+        self.dimensions = dimensions
+        self.leaf_size = leaf_size
+        self.base_size = base_size
+
+        # Each level is None or a dictionary of:
+        # - tree: the ArrayKDTree
+        # - alive: a boolean array of which tree positions haven't been removed
+        # - dead: the number of removed points
+        # - sorted_indices and sorted_positions: the tree's indices in sorted order,
+        # and the position of each, for looking up points by index
+        self.levels = []
+
+
+    def __len__(self):
+        return sum(len(level['tree']) - level['dead'] for level in self.levels if level is not None)
+
+
+    def _capacity(self, level):
+        return self.base_size << level
+
+
+    def _make_level(self, points, indices):
+        tree = ArrayKDTree(points, indices=indices, leaf_size=self.leaf_size)
+        order = np.argsort(tree.indices, kind='mergesort')
+        return {
+            'tree': tree,
+            'alive': np.ones(len(tree), dtype=bool),
+            'dead': 0,
+            'sorted_indices': tree.indices[order],
+            'sorted_positions': order,
+        }
+
+
+    @staticmethod
+    def _alive_points(level):
+        tree, alive = level['tree'], level['alive']
+        return tree.points[alive], tree.indices[alive]
+
+
+    def _find(self, level, indices):
+        """ Return the positions in a level of the given indices, and which were found """
+
+        sorted_indices = level['sorted_indices']
+        slot = np.searchsorted(sorted_indices, indices)
+        slot[slot == len(sorted_indices)] = 0
+        found = sorted_indices[slot] == indices
+        positions = level['sorted_positions'][slot]
+        found &= level['alive'][positions]
+        return positions, found
+
+
+    def add(self, points, indices):
+        """ Add a batch of points with the given indices """
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+        indices = np.asarray(indices, dtype=np.int32).reshape(-1)
+        if len(indices) != len(points):
+            raise ValueError('indices must have one entry for each point')
+        if not len(points):
+            return
+
+        if len(np.unique(indices)) != len(indices) or self.contains(indices).any():
+            raise ValueError('Point indices must be unique')
+
+        # Find the first level that can hold the new points plus every level below it,
+        # and rebuild them all into it.
+        all_points, all_indices = [points], [indices]
+        total = len(points)
+        target = 0
+        while True:
+            if target == len(self.levels):
+                self.levels.append(None)
+
+            level = self.levels[target]
+            if level is not None:
+                level_points, level_indices = self._alive_points(level)
+                all_points.append(level_points)
+                all_indices.append(level_indices)
+                total += len(level_points)
+                self.levels[target] = None
+
+            if total <= self._capacity(target):
+                break
+            target += 1
+
+        self.levels[target] = self._make_level(np.concatenate(all_points), np.concatenate(all_indices))
+
+
+    def contains(self, indices):
+        """ Return a boolean array of which indices are in the tree """
+
+        indices = np.asarray(indices, dtype=np.int32).reshape(-1)
+        result = np.zeros(len(indices), dtype=bool)
+        for level in self.levels:
+            if level is not None:
+                result |= self._find(level, indices)[1]
+        return result
+
+
+    def remove(self, indices):
+        """ Remove the points with the given indices
+
+        Indices that aren't in the tree are ignored. """
+
+        indices = np.asarray(indices, dtype=np.int32).reshape(-1)
+        for level_idx, level in enumerate(self.levels):
+            if level is None:
+                continue
+
+            positions, found = self._find(level, indices)
+            positions = np.unique(positions[found])
+            level['alive'][positions] = False
+            level['dead'] += len(positions)
+
+            # Rebuild the level once half of it is dead.  It only gets smaller, so it still
+            # fits its level.
+            tree = level['tree']
+            if level['dead'] * 2 >= len(tree):
+                if level['dead'] == len(tree):
+                    self.levels[level_idx] = None
+                else:
+                    self.levels[level_idx] = self._make_level(*self._alive_points(level))
+
+
+    def query(self, points, k=1, block_size=4096, eps=0, max_leaves=None):
+        """ Find the k nearest neighbors of each of a list of points
+
+        This is the same as ArrayKDTree.query.  max_leaves applies to each
+        level separately. """
+
+        if k < 1:
+            raise ValueError("k must be greater than 0.")
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+        indices = np.full((len(points), k), -1, dtype=np.int32)
+        distances = np.full((len(points), k), np.inf)
+
+        for level in self.levels:
+            if level is None:
+                continue
+
+            alive = level['alive'] if level['dead'] else None
+            level_indices, level_distances = level['tree']._query(points, k, block_size,
+                    alive, eps, max_leaves)
+
+            all_indices = np.concatenate((indices, level_indices), axis=1)
+            all_distances = np.concatenate((distances, level_distances), axis=1)
+            order = np.argsort(all_distances, axis=1, kind='stable')[:, :k]
+            indices = np.take_along_axis(all_indices, order, axis=1)
+            distances = np.take_along_axis(all_distances, order, axis=1)
+
+        if k == 1:
+            return indices[:, 0], distances[:, 0]
+        return indices, distances
+
+
+
 def level_order(tree, include_all=False):
     """ Returns an iterator over the tree in level-order
 
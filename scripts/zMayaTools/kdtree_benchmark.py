@@ -0,0 +1,325 @@
+"""
+Benchmarks for zMayaTools.kdtree.
+
+These don't need Maya, and can be run directly:
+
+python -m zMayaTools.kdtree_benchmark suite --output results.json
+python -m zMayaTools.kdtree_benchmark suite --compare old-results.json
+python -m zMayaTools.kdtree_benchmark tune
+python -m zMayaTools.kdtree_benchmark approximate
+
+The suite times building and searching ArrayKDTrees on synthetic point sets,
+checks the results against a brute-force numpy search, and writes the timings as
+JSON so they can be compared between versions.
+"""
+
+from __future__ import print_function
+
+import argparse, json, platform, sys, time
+import numpy as np
+
+from zMayaTools import kdtree
+
+def make_surface_points(count, seed=0):
+    """
+    Return (count, 3) points scattered on the surface of a unit sphere.
+
+    Character meshes are surfaces, not volumes, so this is a better stand-in for
+    vertex data than uniformly distributed points.
+    """
+    rng = np.random.RandomState(seed)
+    points = rng.normal(size=(count, 3))
+    points /= np.sqrt((points ** 2).sum(axis=1))[:, None]
+    return points
+
+def make_grid_points(count, seed=0):
+    """
+    Return about count points on a regular grid in the unit cube.
+
+    Grids have lots of points at exactly equal distances and on shared planes.
+    """
+    side = max(2, int(round(count ** (1.0 / 3))))
+    axis = np.linspace(-1, 1, side)
+    points = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1).reshape(-1, 3)
+    return points[:count]
+
+def make_clustered_points(count, seed=0):
+    """
+    Return (count, 3) points clustered like a character mesh.
+
+    Most points are spread over a few large ellipsoid surfaces (the body and limbs),
+    with the rest packed into small, dense clusters (the face and hands).
+    """
+    rng = np.random.RandomState(seed)
+
+    dense_count = count // 3
+    clusters = rng.uniform(-1, 1, size=(12, 3))
+    dense = clusters[rng.randint(len(clusters), size=dense_count)]
+    dense += rng.normal(scale=0.01, size=dense.shape)
+
+    parts = make_surface_points(count - dense_count, seed)
+    part = rng.randint(6, size=len(parts))
+    scales = rng.uniform(0.1, 0.6, size=(6, 3))
+    centers = rng.uniform(-0.5, 0.5, size=(6, 3))
+    parts = parts * scales[part] + centers[part]
+
+    return np.concatenate((parts, dense))
+
+def make_coplanar_points(count, seed=0):
+    """
+    Return (count, 3) points that all lie on the X = 0 plane, with duplicates.
+
+    This is like the vertices along a symmetry seam, and is a bad case for trees that
+    cycle through axes.
+    """
+    rng = np.random.RandomState(seed)
+    points = np.zeros((count, 3))
+    points[:, 1:] = np.round(rng.uniform(-1, 1, size=(count, 2)), 3)
+    return points
+
+point_sets = {
+    'sphere': make_surface_points,
+    'grid': make_grid_points,
+    'clustered': make_clustered_points,
+    'coplanar': make_coplanar_points,
+}
+
+def make_query_points(points, jitter=0.001, seed=1):
+    """
+    Return a copy of points moved slightly, like a second mesh that nearly
+    matches the first.
+    """
+    rng = np.random.RandomState(seed)
+    return points + rng.uniform(-jitter, jitter, size=points.shape)
+
+def _time(func, repeat=3):
+    """
+    Return the fastest time of repeat calls to func.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def tune_leaf_size(point_counts=(10000, 100000, 250000), leaf_sizes=(1, 4, 8, 16, 32, 64, 128), repeat=3):
+    """
+    Time building and batch querying ArrayKDTrees with different leaf sizes, and
+    return the leaf size with the lowest total time over all point counts.
+
+    The queries are every point, jittered slightly, which is what vertex mapping does.
+    """
+    totals = dict((leaf_size, 0) for leaf_size in leaf_sizes)
+
+    print('%10s %10s %10s %10s' % ('points', 'leaf size', 'build', 'query'))
+    for count in point_counts:
+        points = make_surface_points(count)
+        queries = make_query_points(points)
+        for leaf_size in leaf_sizes:
+            build = _time(lambda: kdtree.ArrayKDTree(points, leaf_size=leaf_size), repeat)
+            tree = kdtree.ArrayKDTree(points, leaf_size=leaf_size)
+            query = _time(lambda: tree.query(queries), repeat)
+            totals[leaf_size] += build + query
+            print('%10i %10i %9.3fs %9.3fs' % (count, leaf_size, build, query))
+
+    best = min(leaf_sizes, key=lambda leaf_size: totals[leaf_size])
+    print('Best leaf size: %i' % best)
+    return best
+
+def approximate_tradeoff(count=250000, settings=((0, None), (0.5, None), (1, None), (2, None), (0, 8), (0, 2), (0, 1)), repeat=3):
+    """
+    Measure the speed and accuracy of approximate queries with different eps and
+    max_leaves settings, relative to exact queries.
+
+    Return a list of (eps, max_leaves, relative time, fraction of exact results,
+    worst ratio of found distance to true distance).
+    """
+    points = make_surface_points(count)
+    queries = make_query_points(points, jitter=0.01)
+    tree = kdtree.ArrayKDTree(points)
+
+    exact_time = _time(lambda: tree.query(queries), repeat)
+    exact_indices, exact_dist = tree.query(queries)
+
+    results = []
+    print('%6s %10s %8s %8s %10s' % ('eps', 'max_leaves', 'time', 'exact', 'worst'))
+    for eps, max_leaves in settings:
+        elapsed = _time(lambda: tree.query(queries, eps=eps, max_leaves=max_leaves), repeat)
+        indices, dist = tree.query(queries, eps=eps, max_leaves=max_leaves)
+
+        exact = (dist <= exact_dist).mean()
+        nonzero = exact_dist > 0
+        worst = np.sqrt(dist[nonzero] / exact_dist[nonzero]).max() if nonzero.any() else 1
+        result = (eps, max_leaves, elapsed / exact_time, exact, worst)
+        results.append(result)
+        print('%6g %10s %7.2fx %7.1f%% %10.2f' % (eps, max_leaves or '-', result[2], exact * 100, worst))
+
+    return results
+
+def _brute_force(points, queries, k=1):
+    """
+    Return the squared distances of the k nearest points to each query, by
+    comparing every query against every point.
+    """
+    # Keep each block's distance array to a few million entries.
+    block_size = max(1, 4000000 // max(1, len(points)))
+    result = []
+    for start in range(0, len(queries), block_size):
+        dist = ((queries[start:start + block_size, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+        result.append(np.sort(dist, axis=1)[:, :k])
+    return np.concatenate(result)
+
+def _typical_spacing(points):
+    """
+    Return a rough average distance between neighboring points.
+    """
+    extent = (points.max(axis=0) - points.min(axis=0)).max()
+    return extent / max(1, len(points)) ** (1.0 / 2)
+
+def run_suite(sizes=(1000, 10000, 100000, 1000000), sets=None, single_queries=200, max_batch=250000, k=8, repeat=3):
+    """
+    Run the benchmark suite, returning a dictionary of results that can be written
+    as JSON.
+
+    For each point set and size, this times:
+
+    - build: building the tree
+    - search_nn, search_knn, search_nn_dist: single_queries single-point searches
+    - query, query_knn: one batch query of up to max_batch points
+    - brute_force: a brute-force numpy search for the single-point queries
+
+    Times for searches are also given per query, so sizes can be compared.  Every
+    search is checked against the brute-force result, and a mismatch raises
+    AssertionError.
+    """
+    sets = sets or sorted(point_sets.keys())
+    results = []
+
+    def record(point_set, count, op, seconds, queries=None):
+        entry = {
+            'set': point_set,
+            'count': count,
+            'op': op,
+            'seconds': seconds,
+        }
+        if queries:
+            entry['queries'] = queries
+            entry['per_query'] = seconds / queries
+        results.append(entry)
+        print('%10s %8i %15s %10.4fs %s' % (point_set, count, op, seconds,
+            '(%.2fus per query)' % (entry['per_query'] * 1e6) if queries else ''))
+
+    for point_set in sets:
+        for count in sizes:
+            points = point_sets[point_set](count)
+            count = len(points)
+            queries = make_query_points(points, jitter=_typical_spacing(points))
+            rng = np.random.RandomState(2)
+            single = queries[rng.randint(count, size=min(single_queries, count))]
+            batch = queries[:max_batch]
+            radius = _typical_spacing(points) * 2
+
+            record(point_set, count, 'build', _time(lambda: kdtree.ArrayKDTree(points), repeat))
+            tree = kdtree.ArrayKDTree(points)
+
+            expected = _brute_force(points, single, k)
+            record(point_set, count, 'brute_force', _time(lambda: _brute_force(points, single, k), repeat), len(single))
+
+            found = []
+            record(point_set, count, 'search_nn', _time(lambda: found.__setitem__(slice(None), [tree.search_nn(q) for q in single]), repeat), len(single))
+            assert np.allclose([d for _, d in found], expected[:, 0]), 'search_nn mismatch'
+
+            record(point_set, count, 'search_knn', _time(lambda: found.__setitem__(slice(None), [tree.search_knn(q, k) for q in single]), repeat), len(single))
+            assert np.allclose([[d for _, d in r] for r in found], expected), 'search_knn mismatch'
+
+            record(point_set, count, 'search_nn_dist', _time(lambda: [tree.search_nn_dist(q, radius) for q in single], repeat), len(single))
+            expected_counts = [(((points - q) ** 2).sum(axis=1) < radius * radius).sum() for q in single]
+            assert [len(tree.search_nn_dist(q, radius)) for q in single] == expected_counts, 'search_nn_dist mismatch'
+
+            record(point_set, count, 'query', _time(lambda: tree.query(batch), repeat), len(batch))
+            indices, dist = tree.query(single)
+            assert np.allclose(dist, expected[:, 0]), 'query mismatch'
+
+            record(point_set, count, 'query_knn', _time(lambda: tree.query(batch, k=k), repeat), len(batch))
+            indices, dist = tree.query(single, k=k)
+            assert np.allclose(dist, expected), 'query_knn mismatch'
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'leaf_size': kdtree.ArrayKDTree.default_leaf_size,
+            'k': k,
+        },
+        'results': results,
+    }
+
+def compare_results(old, new, tolerance=0.2):
+    """
+    Compare two sets of results from run_suite, and print the change in each timing.
+
+    Return a list of (set, count, op, ratio) for timings that got slower by more than
+    tolerance.
+    """
+    def key(entry):
+        return entry['set'], entry['count'], entry['op']
+
+    old_results = dict((key(entry), entry) for entry in old['results'])
+    regressions = []
+    for entry in new['results']:
+        old_entry = old_results.get(key(entry))
+        if old_entry is None or not old_entry['seconds']:
+            continue
+
+        ratio = entry['seconds'] / old_entry['seconds']
+        slower = ratio > 1 + tolerance
+        if slower:
+            regressions.append(key(entry) + (ratio,))
+        print('%10s %8i %15s %6.2fx%s' % (key(entry) + (ratio, ' SLOWER' if slower else '')))
+
+    return regressions
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark zMayaTools.kdtree.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    suite = subparsers.add_parser('suite', help='Run the benchmark suite')
+    suite.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    suite.add_argument('--sets', nargs='+', choices=sorted(point_sets.keys()))
+    suite.add_argument('--repeat', type=int, default=3)
+    suite.add_argument('--output', help='Write results to this JSON file')
+    suite.add_argument('--compare', help='Compare against results in this JSON file')
+    suite.add_argument('--tolerance', type=float, default=0.2,
+            help='Fail if a timing is this much slower than in --compare')
+
+    subparsers.add_parser('tune', help='Choose the best leaf size')
+    subparsers.add_parser('approximate', help='Measure approximate search settings')
+
+    args = parser.parse_args(args)
+    if args.command == 'tune':
+        tune_leaf_size()
+    elif args.command == 'approximate':
+        approximate_tradeoff()
+    elif args.command == 'suite':
+        results = run_suite(sizes=args.sizes, sets=args.sets, repeat=args.repeat)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+        if args.compare:
+            with open(args.compare) as f:
+                old = json.load(f)
+            if compare_results(old, results, args.tolerance):
+                return 1
+    else:
+        parser.print_help()
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
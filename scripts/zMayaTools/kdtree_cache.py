@@ -0,0 +1,173 @@
+"""
+An on-disk cache of kdtree.ArrayKDTree indexes.
+
+Trees are keyed by a hash of their points, so running a tool again on an unchanged
+mesh loads the tree it built last time instead of building it again.  Cached trees
+are memory-mapped, so loading one doesn't read the whole file up front.
+
+cache = kdtree_cache.TreeCache()
+tree = cache.get_tree(points)
+
+Nothing is cached unless a TreeCache is created and passed in.  By default, trees are
+stored in zMayaTools/kdtree_cache under the system temporary directory, and the least
+recently used trees are deleted once the cache grows past max_bytes, 512MB by default.
+A tree takes about 40 bytes per point.
+"""
+
+import errno, hashlib, logging, os, tempfile
+import numpy as np
+
+from zMayaTools import kdtree
+
+# This is the logger maya_logging sets up.  Use it directly, since this module doesn't
+# need Maya.
+log = logging.getLogger('zMayaTools')
+
+def default_cache_directory():
+    return os.path.join(tempfile.gettempdir(), 'zMayaTools', 'kdtree_cache')
+
+class TreeCache(object):
+    _extension = '.kdtree'
+
+    def __init__(self, directory=None, max_bytes=512*1024*1024):
+        """
+        Create a cache that stores trees in directory.
+
+        If directory is None, default_cache_directory() is used.  max_bytes is the
+        total size of cached files to keep.
+        """
+        self.directory = directory or default_cache_directory()
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key_for_points(points, indices=None, leaf_size=None):
+        """
+        Return the cache key for a tree of the given points.
+        """
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        if leaf_size is None:
+            leaf_size = kdtree.ArrayKDTree.default_leaf_size
+
+        key = hashlib.sha1()
+        key.update(('%s %i' % (points.shape, leaf_size)).encode('ascii'))
+        key.update(points.tobytes())
+        if indices is not None:
+            key.update(np.ascontiguousarray(indices, dtype=np.int32).tobytes())
+        return key.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self._extension)
+
+    def load_tree(self, points, indices=None, leaf_size=None):
+        """
+        Return the cached ArrayKDTree for points, or None if it isn't cached.
+        """
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        return self._load(self._path(self.key_for_points(points, indices, leaf_size)))
+
+    def get_tree(self, points, indices=None, leaf_size=None, processes=0):
+        """
+        Return an ArrayKDTree for points, loading it from the cache if possible.
+
+        The arguments are the same as for ArrayKDTree.  If the tree isn't cached, it's
+        built and saved.  If processes is greater than one, it's built with
+        ArrayKDTree.build_parallel in that many processes.
+        """
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        path = self._path(self.key_for_points(points, indices, leaf_size))
+        tree = self._load(path)
+        if tree is not None:
+            return tree
+
+        if processes > 1:
+            tree = kdtree.ArrayKDTree.build_parallel(points, indices=indices, leaf_size=leaf_size, processes=processes)
+        else:
+            tree = kdtree.ArrayKDTree(points, indices=indices, leaf_size=leaf_size)
+        self._store(tree, path)
+        return tree
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            return None
+
+        try:
+            tree = kdtree.ArrayKDTree.load(path)
+        except (IOError, OSError, ValueError) as e:
+            log.warning('Couldn\'t load cached kd-tree %s: %s', path, e)
+            return None
+
+        # Mark the file as recently used.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return tree
+
+    def _store(self, tree, path):
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                log.warning('Couldn\'t create kd-tree cache directory %s: %s', self.directory, e)
+                return
+
+        # Write to a temporary file and rename it into place, so another process never
+        # sees a partially-written tree.
+        temp_path = '%s.%i.tmp' % (path, os.getpid())
+        try:
+            tree.save(temp_path)
+            os.rename(temp_path, path)
+        except OSError as e:
+            # On Windows, rename fails if another process cached the same tree first.
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if not os.path.exists(path):
+                log.warning('Couldn\'t cache kd-tree %s: %s', path, e)
+                return
+
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used trees until the cache fits in max_bytes.
+        """
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            return
+
+        entries = []
+        for filename in filenames:
+            if not filename.endswith(self._extension):
+                continue
+
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except OSError as e:
+                # The file may be in use, which prevents deleting it on Windows.
+                log.debug('Couldn\'t evict cached kd-tree %s: %s', path, e)
+                continue
+            total -= size
+
+    def clear(self):
+        """
+        Delete every cached tree.
+        """
+        max_bytes, self.max_bytes = self.max_bytes, 0
+        try:
+            self.evict()
+        finally:
+            self.max_bytes = max_bytes
@@ -316,7 +316,7 @@ class ProgressWindowMaya(util.ProgressWindow):
 
         # Only refresh if we haven't refreshed in a while.  This is slow enough that it
         # can make the import slower if we're showing fine-grained progress.
-        if not force and self.last_refresh is not None and time() - self.last_refresh < 0.1:
+        if not force and self.last_refresh is not None and time.time() - self.last_refresh < 0.1:
             return
 
         self.last_refresh = time.time()
@@ -0,0 +1,163 @@
+"""
+Fast access to mesh vertex positions as numpy arrays.
+
+Reading points with cmds.xform('mesh.vtx[*]') formats every coordinate through a
+flat list of Python floats, and pm.PyNode.getPoints creates an object for every
+vertex.  Both take seconds on large meshes.  This reads the mesh's own point
+array directly, with one call for the whole mesh.
+
+points = mesh_io.get_points('pCube1')
+"""
+
+import ctypes
+import numpy as np
+import maya.OpenMaya as OpenMaya
+import maya.api.OpenMaya as om
+from maya import cmds
+from zMayaTools import topological_symmetry
+
+def get_mesh_dag_path(mesh):
+    """
+    Return an MDagPath for a mesh.
+
+    mesh can be a node name or a PyNode, and can be a mesh shape or a transform with a
+    mesh shape.
+    """
+    selection_list = OpenMaya.MSelectionList()
+    selection_list.add(str(mesh))
+    dag_path = OpenMaya.MDagPath()
+    selection_list.getDagPath(0, dag_path)
+    if not dag_path.hasFn(OpenMaya.MFn.kMesh):
+        dag_path.extendToShape()
+    return dag_path
+
+def get_base_shape(mesh):
+    """
+    Return the full path of the undeformed shape of a mesh.
+
+    For a deformed mesh, this is its original shape: the intermediate shape under the
+    same transform that its deformers read from.  If there isn't one, this is the mesh
+    itself.
+    """
+    shape = get_mesh_dag_path(mesh).fullPathName()
+    if not cmds.listConnections('%s.inMesh' % shape, s=True, d=False):
+        return shape
+
+    history = set(cmds.ls(cmds.listHistory(shape) or [], long=True))
+    parent = cmds.listRelatives(shape, parent=True, fullPath=True)
+    for sibling in cmds.listRelatives(parent, shapes=True, fullPath=True, type='mesh') or []:
+        if sibling == shape or sibling not in history:
+            continue
+        if not cmds.getAttr('%s.intermediateObject' % sibling):
+            continue
+        if cmds.listConnections('%s.inMesh' % sibling, s=True, d=False):
+            continue
+        return sibling
+
+    return shape
+
+def matrix_to_array(matrix):
+    """
+    Return an MMatrix as a (4, 4) array.
+
+    As with MMatrix, points are row vectors: a point is transformed by p * matrix.
+    """
+    return np.array([[matrix(row, col) for col in range(4)] for row in range(4)], dtype=np.float64)
+
+def get_points(mesh, world_space=True):
+    """
+    Return the vertex positions of a mesh as an (N, 3) float64 array.
+
+    If world_space is false, the points are in object space.
+    """
+    dag_path = get_mesh_dag_path(mesh)
+    mesh_fn = OpenMaya.MFnMesh(dag_path)
+    count = mesh_fn.numVertices()
+    if count == 0:
+        return np.zeros((0, 3), dtype=np.float64)
+
+    # getRawPoints returns a pointer to the mesh's float array.  Copy it straight into
+    # numpy, instead of getPoints, which creates an MPoint for every vertex.
+    raw_points = mesh_fn.getRawPoints()
+    buffer = (ctypes.c_float * (count * 3)).from_address(int(raw_points))
+    points = np.frombuffer(buffer, dtype=np.float32).reshape(count, 3).astype(np.float64)
+
+    if world_space:
+        matrix = matrix_to_array(dag_path.inclusiveMatrix())
+        points = points.dot(matrix[:3, :3]) + matrix[3, :3]
+
+    return points
+
+def get_mesh_fn(mesh):
+    """
+    Return an API 2.0 MFnMesh for a mesh.
+    """
+    selection_list = om.MSelectionList()
+    selection_list.add(get_mesh_dag_path(mesh).fullPathName())
+    return om.MFnMesh(selection_list.getDagPath(0))
+
+def get_topology(mesh):
+    """
+    Return the polygons of a mesh as (counts, vertices), two int32 arrays.
+
+    counts is the number of vertices in each face, and vertices is the vertex indices
+    of every face in order, as with MFnMesh.getVertices.
+    """
+    # The API 2.0 arrays are Python sequences, so numpy can read them without going
+    # through MScriptUtil.
+    mesh_fn = get_mesh_fn(mesh)
+    counts, vertices = mesh_fn.getVertices()
+    return np.array(counts, dtype=np.int32), np.array(vertices, dtype=np.int32)
+
+def get_edges(mesh):
+    """
+    Return the vertices of each edge of a mesh as an (E, 2) int32 array.
+
+    Edges are in Maya's edge order, with the lower vertex index first.
+    """
+    # Find the edges from the face list, instead of calling getEdgeVertices for every
+    # edge.  Maya's edge numbering doesn't follow the face list once a mesh has been
+    # edited, so read it with one polyInfo call, and match it against the edges in one
+    # pass.
+    counts, vertices = get_topology(mesh)
+    edges = topological_symmetry.mesh_edges(counts, vertices).astype(np.int64)
+    if not len(edges):
+        return np.zeros((0, 2), dtype=np.int32)
+
+    # Each line is "EDGE      12:      4      5  Hard".
+    info = cmds.polyInfo(get_mesh_dag_path(mesh).fullPathName(), edgeToVertex=True) or []
+    maya_edges = np.array(' '.join(info).split()).reshape(-1, 5)[:, 2:4].astype(np.int64)
+    maya_edges.sort(axis=1)
+
+    vertex_count = int(max(edges.max(), maya_edges.max())) + 1
+    keys = edges[:, 0] * vertex_count + edges[:, 1]
+    maya_keys = maya_edges[:, 0] * vertex_count + maya_edges[:, 1]
+    order = np.argsort(keys)
+    found = order[np.minimum(np.searchsorted(keys, maya_keys, sorter=order), len(keys) - 1)]
+    if len(maya_keys) != len(keys) or (keys[found] != maya_keys).any():
+        raise RuntimeError('The edges of %s don\'t match its faces' % mesh)
+
+    return edges[found].astype(np.int32)
+
+def get_edge_smoothing(mesh):
+    """
+    Return a bool array of whether each edge of a mesh is smooth, in Maya's edge order.
+    """
+    # As in get_edges, read every edge with one polyInfo call rather than calling
+    # isEdgeSmooth for each edge.
+    info = cmds.polyInfo(get_mesh_dag_path(mesh).fullPathName(), edgeToVertex=True) or []
+    return np.array(' '.join(info).split()).reshape(-1, 5)[:, 4] != 'Hard'
+
+def get_triangles(mesh):
+    """
+    Return Maya's triangulation of a mesh.
+
+    Return (triangles, faces): a (T, 3) int32 array of the vertices of each triangle,
+    and the polygon each triangle is part of.
+    """
+    mesh_fn = get_mesh_fn(mesh)
+    triangle_counts, triangle_vertices = mesh_fn.getTriangles()
+    triangle_counts = np.array(triangle_counts, dtype=np.int32)
+    triangles = np.array(triangle_vertices, dtype=np.int32).reshape(-1, 3)
+    faces = np.repeat(np.arange(len(triangle_counts), dtype=np.int32), triangle_counts)
+    return triangles, faces
@@ -1,169 +1,107 @@
 #!/usr/bin/python
-import math 
-from pprint import pprint
-
-
-#def cholesky(L):
-#    L = [[0] * len(L) for _ in xrange(len(L))]
-# 
-#    for i in xrange(len(L)):
-#        for j in xrange(i+1):
-#            s = 0;
-#
-#            for k in xrange(j):
-#                s += L[i][k] * L[j][k]
-#            if i == j:
-#                v = math.sqrt(L[i][i] - s)
-#            else:
-#                v = (1.0 / L[j][j] * (L[i][j] - s))
-#            L[i][j] = v
-# 
-#    return L
- 
- 
-#def cholesky(L):
-#    L = [[0.0] * len(L) for _ in xrange(len(L))]
-#    for i in xrange(len(L)):
-#        for j in xrange(i+1):
-#            s = sum(L[i][k] * L[j][k] for k in xrange(j))
-#            L[i][j] = math.sqrt(L[i][i] - s) if (i == j) else \
-#                      (1.0 / L[j][j] * (L[i][j] - s))
-#    return L
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    # Without numpy, solving falls back on pure Python, which is much slower for
+    # large numbers of samples.
+    np = None
 
 class SolveFailedError(ValueError):
     pass
 
-# Ernesto P. Adorio, Ph.D.  ernesto.adorio@gmail.com
-# UPDEPP at Clark Field, Pampanga
-def Cholesky(L, ztol= 1.0e-5):
+def _check_conditioning(matrix_norm, weight_norm, value_norm, ztol):
     """
-    Computes the upper triangular Cholesky factorization of  
-    L positive definite matrix L.
+    Raise SolveFailedError if a solution shows that its matrix is too badly conditioned.
+
+    A nearly singular matrix solves without an error, but gives huge weights that cancel
+    out at the samples and give garbage everywhere else, such as when two samples are
+    at nearly the same position.  Since |b| <= |A| |x|, |A| |x| / |b| is a lower bound on
+    the condition number of A, and it's large exactly when the weights blow up.  This is
+    much cheaper than computing the condition number, and both solvers use it, so they
+    accept and reject the same systems.  The norms are infinity norms.
     """
-    # Forward step for symmetric triangular t.
-    t = [[0]*len(L) for _ in xrange(len(L))]
-    for i in xrange(len(L)):
-        s = sum((t[k][i])**2 for k in xrange(i))
-        d = L[i][i] - s
-        if abs(d) < ztol:
-            d = 0
+    if value_norm == 0:
+        # b is zero, so x is zero too.
+        return
 
-        try:
-            t[i][i] = math.sqrt(d)
-        except ValueError:
-            raise SolveFailedError('Matrix not positive-definite')
+    # This is written so NaN fails too.
+    if not matrix_norm * weight_norm <= value_norm / ztol:
+        raise SolveFailedError('Matrix is singular')
 
-        try:
-            for j in xrange(i+1, len(L)):
-                S = sum([t[k][i] * t[k][j] for k in range(i)])
-                if abs(S) < ztol:
-                    S = 0.0
-
-                t[i][j] = (L[i][j] - S)/t[i][i]
-        except ZeroDivisionError:
-            raise SolveFailedError('Zero diagonal')
-    return t
-
-#def go1():
-#    m1 = [[25, 15, 5],
-#          [15, 18,  0],
-#          [5,  0, 11]]
-#    pprint(cholesky(m1))
-#    print
-#    f()
-# 
-#    m2 = [[18, 22,  54,  42],
-#          [22, 70,  86,  62],
-#          [54, 86, 174, 134],
-#          [42, 62, 134, 106]]
-#    pprint(cholesky(m2), width=120)
-
-
-def transpose(A):
-    C = [[0]*len(A) for _ in xrange(len(A[0]))]
-
-    for i in range(len(A)):
-        for j in range(len(A[i])):
-            C[j][i] = A[i][j]
-
-    return C
- 
-def forward_solve(A, b):
-    """Forward solve the lower triangular system Ax = b"""
-    x = [0]*len(A)
-
-    for i in range(len(A)):
-        x[i] = b[i]
-
-        for k in range(i):
-            x[i] -= A[i][k] * x[k]
+def solve(A, b, ztol=1.0e-10):
+    """
+    Solve Ax=b for x, where A is a square matrix and b is a vector.
 
-        try:
-            x[i] /= A[i][i]
-        except ZeroDivisionError:
-            raise SolveFailedError('No solution')
+    b can also be a list of rows, one for each row of A, to solve several right-hand
+    sides with one elimination.  x is then a list of rows too.
 
+    This is the pure Python fallback for when numpy isn't available.  It uses Gaussian
+    elimination with partial pivoting, since RBF kernel matrices are symmetric but not
+    always positive definite.  SolveFailedError is raised in the same cases as with
+    solve_numpy.
+    """
+    n = len(A)
+    multiple = n > 0 and isinstance(b[0], (list, tuple))
+    rows = [list(row) for row in b] if multiple else [[value] for value in b]
+    width = n + (len(rows[0]) if n else 0)
+
+    # Work on an augmented copy of the matrix.
+    M = [list(A[i]) + rows[i] for i in xrange(n)]
+    for col in xrange(n):
+        pivot = max(xrange(col, n), key=lambda row: abs(M[row][col]))
+        if M[pivot][col] == 0:
+            raise SolveFailedError('Matrix is singular')
+        M[col], M[pivot] = M[pivot], M[col]
+
+        pivot_row = M[col]
+        for row in xrange(col+1, n):
+            factor = M[row][col] / pivot_row[col]
+            if factor == 0:
+                continue
+            target = M[row]
+            for k in xrange(col, width):
+                target[k] -= factor * pivot_row[k]
+
+    # Back substitute each right-hand side.
+    x = [[0.0]*(width-n) for _ in xrange(n)]
+    for i in reversed(xrange(n)):
+        for c in xrange(width-n):
+            s = M[i][n+c]
+            for k in xrange(i+1, n):
+                s -= M[i][k] * x[k][c]
+            x[i][c] = s / M[i][i]
+
+    matrix_norm = max([sum(abs(value) for value in row) for row in A] or [0])
+    for c in xrange(width-n):
+        _check_conditioning(matrix_norm, max(abs(row[c]) for row in x), max(abs(row[c]) for row in rows), ztol)
+
+    if not multiple:
+        return [row[0] for row in x]
     return x
 
+def solve_numpy(A, b, ztol=1.0e-10):
+    """
+    Solve Ax=b for x with numpy.
 
-def backtrack_solve(A, b):
-    """Backtrack solve the upper triangular system Ax = b"""
-    x = [0]*len(A)
-
-    for i in reversed(range(len(A))):
-       x[i] = b[i]
-
-       for k in reversed(range(i+1, len(A))):
-           x[i] -= A[i][k] * x[k]
-
-       x[i] /= A[i][i]
+    b can be an (N, C) array to solve C right-hand sides against one factorization.
 
-    return x
-
-def solve(A, b):
-    """
-    Solve Ab=x for b, where A is a matrix and b is a vector.
+    SolveFailedError is raised if A is singular, or too badly conditioned to give a
+    useful answer for b.
     """
-    print 'A:'
-    print_matrix(A)
-    print 'b', b
-    upper = Cholesky(A)
-    # print 'upper'
-    # print_matrix(upper)
-    lower = transpose(upper)
-    # print 'lower'
-    # print_matrix(lower)
-    values = forward_solve(lower, b)
-    return backtrack_solve(upper, values)
-
-def dot(mat, vec):
-    result = [0]*len(mat)
-    assert len(mat[0]) == len(vec)
-    for values in xrange(len(mat)):
-        for x in xrange(len(mat[values])):
-            result[values] += mat[values][x]*vec[x]
-            pass
-    return result
-
-
-def mult(lhs, rhs):
-    a = len(lhs)
-    b = len(rhs[0])
-    result = [[0]*b for _ in xrange(a)]
-    for c in range(a):
-        for d in range(b):
-            s = 0
-            for k in range(len(rhs)):
-                s += lhs[c][k]*rhs[k][d]
- 
-            result[c][d] = s
-    return result
-
-def print_matrix(m):
-    for row in m:
-        for col in row:
-            print ('%5.1f' % col),
-        print
+    try:
+        x = np.linalg.solve(A, b)
+    except np.linalg.LinAlgError:
+        raise SolveFailedError('Matrix is singular')
+
+    if len(A):
+        matrix_norm = np.abs(A).sum(axis=1).max()
+        weight_norms = np.abs(x).reshape(len(A), -1).max(axis=0)
+        value_norms = np.abs(b).reshape(len(A), -1).max(axis=0)
+        for weight_norm, value_norm in zip(weight_norms.tolist(), value_norms.tolist()):
+            _check_conditioning(matrix_norm, weight_norm, value_norm, ztol)
+    return x
 
 class rbf(object):
     @staticmethod
@@ -188,64 +126,100 @@ class rbf(object):
     def solvable(self):
         return self.result is not None
 
-    def __init__(self, values, points):
+    # The same kernels, taking an array of squared distances.
+    @staticmethod
+    def array_linear(r):
+        return np.sqrt(r)
+
+    @staticmethod
+    def array_gaussian(r):
+        return np.exp(-r)
+
+    def __init__(self, values, points, channels=None):
+        """
+        Solve an RBF through the given sample points.
+
+        values has one entry for each point.  Each entry can be a number, or a sequence
+        of numbers to interpolate several channels at once.  All channels are solved
+        with one factorization, so this is much faster than an rbf for each channel.
+        Every sequence must have the same length.  If values may be empty, pass the
+        number of channels in channels, so eval still returns a list.
+        """
         self.points = points
         #self.func = self.gaussian
         self.func = self.linear
+        self.array_func = self.array_linear
         self.result = None
 
         assert len(values) == len(points)
 
+        # The number of channels in each value, or None if values are numbers.
+        self.channels = channels
+        if len(values) and isinstance(values[0], (list, tuple)):
+            self.channels = len(values[0])
+            assert all(len(value) == self.channels for value in values)
+
         # Solving will always fail if we have less than two values.
         if len(points) <= 1:
             return
 
-        X = []
-        for i in xrange(len(points)):
-            item = []
-            for j in xrange(len(points)):
-                total_squared = 0
-                for channel in xrange(len(points[i])):
-                    delta = points[i][channel] - points[j][channel]
-                    total_squared += delta*delta
-                item.append(self.func(total_squared))
-            X.append(item)
-#            print 'append', item
-
-        # print 'X:'
-        # print_matrix(X)
-
-        Xt = transpose(X)
-        # print 'Xt:'
-        # print_matrix(Xt)
-
-        XtX = mult(Xt, X)
-        # print 'XtX'
-        # print_matrix(XtX)
-
-        Xty = dot(Xt, values)
-        # print 'Xty', Xty
-
+        # The kernel matrix is square and symmetric, so solve it directly rather than
+        # through the normal equations, which square its condition number.
         try:
-            self.result = solve(XtX, Xty)
-            # print 's:', self.result
+            if np is not None:
+                self.points = np.array(points, dtype=np.float64)
+                X = self.array_func(self._squared_distances(self.points, self.points))
+                self.result = solve_numpy(X, np.array(values, dtype=np.float64))
+            else:
+                X = []
+                for i in xrange(len(points)):
+                    item = []
+                    for j in xrange(len(points)):
+                        total_squared = 0
+                        for channel in xrange(len(points[i])):
+                            delta = points[i][channel] - points[j][channel]
+                            total_squared += delta*delta
+                        item.append(self.func(total_squared))
+                    X.append(item)
+
+                self.result = solve(X, values)
         except SolveFailedError:
             self.result = None
 
+    @staticmethod
+    def _squared_distances(a, b):
+        # Return the squared distance between every point in a and every point in b.
+        delta = a[:,np.newaxis,:] - b[np.newaxis,:,:]
+        return (delta*delta).sum(axis=2)
+
     def eval(self, t):
+        """
+        Evaluate the RBF at t.
+
+        If the values were sequences, return a list with a value for each channel.
+        """
         if self.result is None:
-            return 0
+            return 0 if self.channels is None else [0]*self.channels
+
+        if np is not None:
+            t = np.array(t, dtype=np.float64).reshape(1, -1)
+            weights = self.array_func(self._squared_distances(t, self.points))[0]
+            out = weights.dot(self.result)
+            return float(out) if self.channels is None else out.tolist()
 
-        out = 0
+        out = [0]*(self.channels or 1)
         for i in xrange(len(self.result)):
             total_squared = 0
             for channel in xrange(len(self.points[i])):
                 delta = t[channel] - self.points[i][channel]
                 total_squared += delta*delta
 
-            out += self.result[i] * self.func(total_squared)
+            weight = self.func(total_squared)
+            result = self.result[i] if self.channels is not None else (self.result[i],)
+            for c in xrange(len(out)):
+                out[c] += result[c] * weight
 
-        return out
+        return out[0] if self.channels is None else out
 
 def xgo():
     points = [(0, 0, 0),]
@@ -261,25 +235,3 @@ def xgo():
 
 if __name__ == "__main__":
     xgo()
-
-# https://github.com/jpaasen/cos/blob/master/framework/cholesky.py
-# The MIT License (MIT)
-# 
-# Copyright (c) 2014 Jon Petter Asen
-# 
-# Permission is hereby granted, free of charge, to any person obtaining a copy of
-# this software and associated documentation files (the "Software"), to deal in
-# the Software without restriction, including without limitation the rights to
-# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
-# the Software, and to permit persons to whom the Software is furnished to do so,
-# subject to the following conditions:
-# 
-# The above copyright notice and this permission notice shall be included in all
-# copies or substantial portions of the Software.
-# 
-# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
-# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
-# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
-# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
-# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
-# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
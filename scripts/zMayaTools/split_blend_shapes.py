@@ -6,26 +6,66 @@ import maya.OpenMayaAnim as OpenMayaAnim
 from zMayaTools.menus import Menu
 from zMayaTools import maya_logging, maya_helpers
 
+try:
+    import numpy as np
+except ImportError:
+    # Maya 2020 and earlier don't come with numpy.  Without it, vertices are read and
+    # split with slower pure Python code.
+    np = None
+else:
+    from zMayaTools import mesh_io
+
 log = maya_logging.get_log()
 
 def scale(x, l1, h1, l2, h2):
     return (x - l1) * (h2 - l2) / (h1 - l1) + l2
+
+def _split_blend_shape_numpy(base_mesh, target_mesh, right_side, fade_distance, axis, axis_origin):
+    target_pos = mesh_io.get_points(target_mesh)
+    base_pos = mesh_io.get_points(base_mesh)
+    if len(target_pos) != len(base_pos):
+        OpenMaya.MGlobal.displayError('Target has %i vertices, but base has %i vertices.' % (len(target_pos), len(base_pos)))
+        return
+
+    dist = target_pos[:, axis] - axis_origin
+
+    if fade_distance == 0:
+        p = np.where(dist < 0, 0.0, 1.0)
+    else:
+        p = scale(dist, -fade_distance/2.0, fade_distance/2.0, 0, 1.0)
+
+    # If we're fading in the left side instead of the right, flip the value.
+    if not right_side:
+        p = 1-p
+
+    p = np.clip(p, 0, 1)
+
+    # Clean up the percentage.  It's easy to end up with lots of values like 0.000001, and clamping
+    # them to zero or one can give a smaller file.
+    p[p < 0.001] = 0
+    p[p > .999] = 1
+
+    delta = target_pos - base_pos
+    new_target_pos = base_pos + delta * p[:, np.newaxis]
+
+    # Only move the vertices that changed.  Vertices are moved one at a time with cmds.xform
+    # so the change can be undone.
+    distance_squared = ((new_target_pos - target_pos) ** 2).sum(axis=1)
+    for idx in np.flatnonzero(distance_squared >= 0.0001).tolist():
+        cmds.xform('%s.vtx[%i]' % (target_mesh, idx), t=new_target_pos[idx].tolist(), ws=True)
+
 def _to_vtx_list(p):
     return [(x, y, z) for x, y, z in zip(p[0::3], p[1::3], p[2::3])]
 
-def split_blend_shape(base_mesh, target_mesh, right_side=True, fade_distance=2, axis=0, axis_origin=0):
-    # Read the positions in world space.  Although the shapes should be in the same position,
-    # we want world space units so the distance factor makes sense.
-    #
+def _split_blend_shape_python(base_mesh, target_mesh, right_side, fade_distance, axis, axis_origin):
     # We do this with cmds instead of pm, since it's faster for dealing with lots of vertex
     # data.
     target_pos = _to_vtx_list(cmds.xform('%s.vtx[*]' % target_mesh, q=True, t=True, ws=True))
     base_pos = _to_vtx_list(cmds.xform('%s.vtx[*]' % base_mesh, q=True, t=True, ws=True))
     if len(target_pos) != len(base_pos):
-        OpenMaya.MGlobal.displayError('Target has %i vertices, but base has %i vertices.' % (len(target_pos) != len(base_pos)))
+        OpenMaya.MGlobal.displayError('Target has %i vertices, but base has %i vertices.' % (len(target_pos), len(base_pos)))
         return
 
-    result_pos = []
     new_target_pos = []
     for idx in xrange(len(target_pos)):
         dist = target_pos[idx][axis]
@@ -62,6 +102,14 @@ def split_blend_shape(base_mesh, target_mesh, right_side=True, fade_distance=2,
             continue
         cmds.xform('%s.vtx[%i]' % (target_mesh, idx), t=new_target_pos[idx], ws=True)
 
+def split_blend_shape(base_mesh, target_mesh, right_side=True, fade_distance=2, axis=0, axis_origin=0):
+    # Read the positions in world space.  Although the shapes should be in the same position,
+    # we want world space units so the distance factor makes sense.
+    if np is None:
+        _split_blend_shape_python(base_mesh, target_mesh, right_side, fade_distance, axis, axis_origin)
+    else:
+        _split_blend_shape_numpy(base_mesh, target_mesh, right_side, fade_distance, axis, axis_origin)
+
 def get_connected_input_geometry(blend_shape):
 	"""
 	Return an array of blend_shape's input plugs that have an input connection.
@@ -0,0 +1,143 @@
+"""
+Find the correspondence between a base mesh and its Catmull-Clark subdivision.
+
+One level of Catmull-Clark subdivision splits each n-sided face into n quads.  Every
+quad has one corner at a vertex point (a vertex of the base mesh), two at edge points
+(the middles of base edges) and one at the face point (the middle of the base face).
+This walks both meshes' faces together from one known starting edge, so the
+correspondence comes from topology alone, and works however far a sculpt has moved
+from the limit surface.
+
+As with topological_symmetry, meshes are given as face vertex counts and indices, so
+this doesn't need Maya.  For more than one level of subdivision, map one level at a
+time.
+"""
+
+from collections import deque, namedtuple
+import numpy as np
+
+from zMayaTools import topological_symmetry
+
+# vertex_points, edge_points and face_points give the subdivided vertex for each base
+# vertex, edge and face.  kind and source give the reverse: for each subdivided vertex,
+# whether it's a vertex, edge or face point (VERTEX_POINT, EDGE_POINT or FACE_POINT), and
+# the index of the base vertex, edge or face it came from.  Anything not reached from the
+# seed is -1.
+SubdivisionMap = namedtuple('SubdivisionMap', ['vertex_points', 'edge_points', 'face_points', 'kind', 'source'])
+
+VERTEX_POINT = 0
+EDGE_POINT = 1
+FACE_POINT = 2
+
+def make_subdivision_map(base_counts, base_face_vertices, subdivided_counts, subdivided_face_vertices,
+        seed, base_edges=None):
+    """
+    Map a base mesh to a mesh subdivided from it once.
+
+    seed gives one known correspondence as ((v, w), (sv, se)): v and w are the vertices
+    of a base edge, sv is the subdivided vertex at v, and se is the subdivided vertex
+    at the middle of the edge v-w.  Topology alone can't tell apart symmetric parts of a
+    mesh, so one edge has to be given.
+
+    base_edges is an (E, 2) array of the base mesh's edges, which edge indices in the
+    result refer to.  If it's None, topological_symmetry.mesh_edges is used.
+
+    Return a SubdivisionMap.  Everything connected to the seed is mapped, so separate
+    mesh shells need a seed each.  ValueError is raised if the subdivided mesh isn't a
+    subdivision of the base mesh.
+    """
+    base_half_edges, base_faces = topological_symmetry.half_edge_map(base_counts, base_face_vertices)
+    sub_half_edges, sub_faces = topological_symmetry.half_edge_map(subdivided_counts, subdivided_face_vertices)
+
+    if base_edges is None:
+        base_edges = topological_symmetry.mesh_edges(base_counts, base_face_vertices)
+    base_edges = np.asarray(base_edges, dtype=np.int64).reshape(-1, 2)
+    edge_indices = {}
+    for edge_idx, (v1, v2) in enumerate(base_edges.tolist()):
+        edge_indices[(min(v1, v2), max(v1, v2))] = edge_idx
+
+    base_vertex_count = int(np.max(base_face_vertices)) + 1 if len(base_face_vertices) else 0
+    sub_vertex_count = int(np.max(subdivided_face_vertices)) + 1 if len(subdivided_face_vertices) else 0
+
+    vertex_points = [-1] * base_vertex_count
+    edge_points = [-1] * len(base_edges)
+    face_points = [-1] * len(base_faces)
+    kind = [-1] * sub_vertex_count
+    source = [-1] * sub_vertex_count
+
+    def assign(points, point_kind, base_idx, sub_idx):
+        if points[base_idx] == -1 and kind[sub_idx] == -1:
+            points[base_idx] = sub_idx
+            kind[sub_idx] = point_kind
+            source[sub_idx] = base_idx
+        elif points[base_idx] != sub_idx or kind[sub_idx] != point_kind:
+            raise ValueError('The mesh isn\'t a subdivision of the base mesh at subdivided vertex %i' % sub_idx)
+
+    def edge_index(v1, v2):
+        edge_idx = edge_indices.get((min(v1, v2), max(v1, v2)))
+        if edge_idx is None:
+            raise ValueError('Edge %i-%i isn\'t in base_edges' % (v1, v2))
+        return edge_idx
+
+    (v, w), (sv, se) = seed
+    if (v, w) not in base_half_edges:
+        if (w, v) not in base_half_edges:
+            raise ValueError('%i-%i isn\'t a base mesh edge' % (v, w))
+        raise ValueError('The seed edge %i-%i is a border edge facing the wrong way.  Use %i-%i.' % (v, w, w, v))
+    if (sv, se) not in sub_half_edges:
+        raise ValueError('%i-%i isn\'t a subdivided mesh edge, or faces the wrong way' % (sv, se))
+
+    # Each queue entry is a base face and the position of one of its vertices, and the
+    # subdivided quad for that corner with the position of its vertex point.  The quad for
+    # corner v of a face, wound the same way, is (v, mid(v, next), face point, mid(prev, v)).
+    face_visited = [False] * len(base_faces)
+    queue = deque([base_half_edges[(v, w)] + sub_half_edges[(sv, se)]])
+    while queue:
+        base_face, base_pos, sub_face, sub_pos = queue.popleft()
+        if face_visited[base_face]:
+            continue
+        face_visited[base_face] = True
+
+        # Walk around the base face and its quads together.
+        face = base_faces[base_face]
+        count = len(face)
+        for step in range(count):
+            quad = sub_faces[sub_face]
+            if len(quad) != 4:
+                raise ValueError('The mesh isn\'t a subdivision of the base mesh: face %i isn\'t a quad' % sub_face)
+            quad = [quad[(sub_pos + idx) % 4] for idx in range(4)]
+
+            vertex = face[base_pos]
+            next_vertex = face[(base_pos + 1) % count]
+            prev_vertex = face[base_pos - 1]
+            assign(vertex_points, VERTEX_POINT, vertex, quad[0])
+            assign(edge_points, EDGE_POINT, edge_index(vertex, next_vertex), quad[1])
+            assign(face_points, FACE_POINT, base_face, quad[2])
+            assign(edge_points, EDGE_POINT, edge_index(prev_vertex, vertex), quad[3])
+
+            # The quad for v in the face across the edge v-next has mid(v, next) at
+            # position 3, so its vertex point is at the next position.
+            base_neighbor = base_half_edges.get((next_vertex, vertex))
+            sub_neighbor = sub_half_edges.get((quad[1], quad[0]))
+            if base_neighbor is not None and sub_neighbor is not None:
+                neighbor_face, neighbor_pos = base_neighbor
+                if not face_visited[neighbor_face]:
+                    queue.append((neighbor_face, (neighbor_pos + 1) % len(base_faces[neighbor_face]),
+                            sub_neighbor[0], (sub_neighbor[1] + 1) % 4))
+            elif base_neighbor is not None or sub_neighbor is not None:
+                raise ValueError('The mesh isn\'t a subdivision of the base mesh at base edge %i-%i' % (vertex, next_vertex))
+
+            # The quad for the next corner of the same face is across the edge from the
+            # face point to mid(v, next), and has that edge from its position 2.
+            neighbor = sub_half_edges.get((quad[2], quad[1]))
+            if neighbor is None:
+                raise ValueError('The mesh isn\'t a subdivision of the base mesh at subdivided face %i' % sub_face)
+            sub_face, sub_pos = neighbor[0], (neighbor[1] + 2) % 4
+            base_pos = (base_pos + 1) % count
+
+    return SubdivisionMap(
+            np.array(vertex_points, dtype=np.int32),
+            np.array(edge_points, dtype=np.int32),
+            np.array(face_points, dtype=np.int32),
+            np.array(kind, dtype=np.int8),
+            np.array(source, dtype=np.int32))
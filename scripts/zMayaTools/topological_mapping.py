@@ -0,0 +1,103 @@
+"""
+Match the vertices of two meshes with the same topology from their connectivity.
+
+Starting from one pair of corresponding faces, this walks outwards across both
+meshes' faces together, so it finds the correspondence however differently the
+vertices are numbered or the meshes are shaped.  Each face and edge is visited once.
+
+As with topological_symmetry, meshes are given as face vertex counts and indices, so
+this doesn't need Maya.
+"""
+
+from collections import deque
+import numpy as np
+
+from zMayaTools import topological_symmetry
+
+def make_topology_map(src_counts, src_face_vertices, dst_counts, dst_face_vertices, seed_faces, seed_vertices):
+    """
+    Map a mesh onto another mesh with the same topology.
+
+    seed_faces is (src_face, dst_face), a face on each mesh that correspond, and
+    seed_vertices is (src_vertex, dst_vertex), a vertex of each of those faces that
+    correspond.  Both meshes must have the same winding.
+
+    Return (vertex_map, face_map, corner_map), int32 arrays giving the destination
+    index of each source vertex, face and face vertex.  Face vertices are indexed into
+    the flat face vertex list.  Anything not connected to the seed faces is mapped to
+    -1, so separate mesh shells need a seed each.
+
+    ValueError is raised if the meshes don't have the same topology.
+    """
+    src_half_edges, src_faces = topological_symmetry.half_edge_map(src_counts, src_face_vertices)
+    dst_half_edges, dst_faces = topological_symmetry.half_edge_map(dst_counts, dst_face_vertices)
+    src_offsets = (np.cumsum(src_counts) - src_counts).tolist()
+    dst_offsets = (np.cumsum(dst_counts) - dst_counts).tolist()
+
+    src_vertex_count = int(np.max(src_face_vertices)) + 1 if len(src_face_vertices) else 0
+    dst_vertex_count = int(np.max(dst_face_vertices)) + 1 if len(dst_face_vertices) else 0
+
+    vertex_map = [-1] * src_vertex_count
+    reverse_vertex_map = [-1] * dst_vertex_count
+    face_map = [-1] * len(src_faces)
+    reverse_face_map = [-1] * len(dst_faces)
+    corner_map = [-1] * len(src_face_vertices)
+
+    src_face, dst_face = seed_faces
+    src_vertex, dst_vertex = seed_vertices
+    for face, faces, vertex, name in ((src_face, src_faces, src_vertex, 'source'), (dst_face, dst_faces, dst_vertex, 'destination')):
+        if not 0 <= face < len(faces):
+            raise ValueError('The %s mesh has no face %i' % (name, face))
+        if vertex not in faces[face]:
+            raise ValueError('Vertex %i isn\'t part of %s face %i' % (vertex, name, face))
+
+    # Each queue entry is a pair of corresponding faces, with the position in each face of
+    # a pair of corresponding vertices.
+    queue = deque([(src_face, src_faces[src_face].index(src_vertex), dst_face, dst_faces[dst_face].index(dst_vertex))])
+    while queue:
+        f1, pos1, f2, pos2 = queue.popleft()
+        if face_map[f1] != -1 or reverse_face_map[f2] != -1:
+            if face_map[f1] != f2:
+                raise ValueError('The meshes don\'t match at source face %i' % f1)
+            continue
+
+        face1, face2 = src_faces[f1], dst_faces[f2]
+        count = len(face1)
+        if len(face2) != count:
+            raise ValueError('The meshes don\'t match: source face %i has %i vertices, but destination face %i has %i' %
+                    (f1, count, f2, len(face2)))
+
+        face_map[f1] = f2
+        reverse_face_map[f2] = f1
+
+        for step in range(count):
+            corner1 = (pos1 + step) % count
+            corner2 = (pos2 + step) % count
+            corner_map[src_offsets[f1] + corner1] = dst_offsets[f2] + corner2
+
+            v1, v2 = face1[corner1], face2[corner2]
+            if vertex_map[v1] == -1 and reverse_vertex_map[v2] == -1:
+                vertex_map[v1] = v2
+                reverse_vertex_map[v2] = v1
+            elif vertex_map[v1] != v2:
+                raise ValueError('The meshes don\'t match at source vertex %i' % v1)
+
+        # Queue the faces across each edge.  The face across u -> v has v -> u, with v at
+        # the position of that half edge.
+        for step in range(count):
+            u1, v1 = face1[(pos1 + step) % count], face1[(pos1 + step + 1) % count]
+            u2, v2 = face2[(pos2 + step) % count], face2[(pos2 + step + 1) % count]
+            neighbor1 = src_half_edges.get((v1, u1))
+            neighbor2 = dst_half_edges.get((v2, u2))
+            if neighbor1 is None and neighbor2 is None:
+                # Both edges are borders.
+                continue
+            if neighbor1 is None or neighbor2 is None:
+                raise ValueError('The meshes don\'t match at source edge %i-%i' % (u1, v1))
+
+            if face_map[neighbor1[0]] == -1 or reverse_face_map[neighbor2[0]] == -1:
+                queue.append(neighbor1 + neighbor2)
+
+    return (np.array(vertex_map, dtype=np.int32),
+            np.array(face_map, dtype=np.int32),
+            np.array(corner_map, dtype=np.int32))
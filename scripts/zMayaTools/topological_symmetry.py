@@ -0,0 +1,190 @@
+"""
+Find mesh symmetry from topology instead of vertex positions.
+
+Starting from an edge on the plane of symmetry, this walks outwards across faces on
+both sides of the mesh at once, pairing each face with its mirror.  This works on
+posed or sculpted meshes that are no longer symmetric in space, and visits each face
+and edge once.
+
+Meshes are given as face vertex counts and face vertex indices, as returned by
+MFnMesh.getVertices or mesh_io.get_topology, so this doesn't need Maya.
+"""
+
+from collections import deque
+import numpy as np
+
+def _corners(counts, face_vertices):
+    """
+    Return per-corner arrays describing each face's directed edges.
+
+    Returns (face, position, start, end): the face each corner belongs to, its position
+    in the face, and the vertices of the directed edge from it to the next corner.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    face_vertices = np.asarray(face_vertices, dtype=np.int64)
+    if counts.sum() != len(face_vertices):
+        raise ValueError('face_vertices must have counts.sum() entries')
+
+    offsets = np.cumsum(counts) - counts
+    face = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(len(face_vertices)) - offsets[face]
+    next_corner = np.where(position + 1 == counts[face], offsets[face], np.arange(len(face_vertices)) + 1)
+    return face, position, face_vertices, face_vertices[next_corner]
+
+def _edge_keys(v1, v2, vertex_count):
+    return np.minimum(v1, v2) * vertex_count + np.maximum(v1, v2)
+
+def mesh_edges(counts, face_vertices):
+    """
+    Return the edges of a mesh as an (E, 2) array of vertex indices.
+
+    Edges are in the order they're first seen in the face list, with the lower vertex
+    index first.
+    """
+    face, position, start, end = _corners(counts, face_vertices)
+    vertex_count = int(start.max()) + 1 if len(start) else 0
+    keys, first = np.unique(_edge_keys(start, end, vertex_count), return_index=True)
+    first = np.sort(first)
+    return np.column_stack((np.minimum(start[first], end[first]), np.maximum(start[first], end[first]))).astype(np.int32)
+
+def half_edge_map(counts, face_vertices):
+    """
+    Return (half_edges, faces) for a mesh.
+
+    half_edges maps each directed edge (a, b) to the face it belongs to and the position
+    of a in that face.  In a manifold mesh with consistent winding, each directed edge
+    belongs to only one face, and the face on the other side has (b, a).  faces is a list
+    of each face's vertex list.
+
+    ValueError is raised if a directed edge appears twice, which means the mesh is
+    non-manifold or its normals are inconsistent.
+    """
+    face_vertices = np.asarray(face_vertices, dtype=np.int64)
+    face, position, start, end = _corners(counts, face_vertices)
+    vertex_count = int(face_vertices.max()) + 1 if len(face_vertices) else 0
+
+    directed_keys = start * vertex_count + end
+    unique_keys, key_counts = np.unique(directed_keys, return_counts=True)
+    if len(unique_keys) != len(directed_keys):
+        duplicate = int(unique_keys[np.argmax(key_counts)])
+        raise ValueError('The mesh is non-manifold or has inconsistent normals at edge %i-%i' %
+                (duplicate // vertex_count, duplicate % vertex_count))
+    half_edges = dict(zip(zip(start.tolist(), end.tolist()), zip(face.tolist(), position.tolist())))
+
+    offsets = (np.cumsum(counts) - counts).tolist()
+    all_face_vertices = face_vertices.tolist()
+    faces = [all_face_vertices[offset:offset+count] for offset, count in zip(offsets, np.asarray(counts).tolist())]
+    return half_edges, faces
+
+def make_symmetry_map(counts, face_vertices, seam_edge, edges=None, vertex_count=None):
+    """
+    Make topological vertex, edge and face symmetry maps.
+
+    seam_edge is a (vertex, vertex) pair for an edge on the plane of symmetry.  It
+    must have a face on each side.
+
+    edges is an (E, 2) array of each edge's vertices, which edge indices in the result
+    refer to.  If it's None, mesh_edges is used.  vertex_count is the number of
+    vertices, if there are unused vertices past the last one referenced by a face.
+
+    Return (vertex_map, edge_map, face_map), int32 arrays giving the mirrored index of
+    each vertex, edge and face.  Vertices and edges on the plane of symmetry and faces
+    crossing it map to themselves.  Anything that isn't connected to seam_edge, such as
+    other mesh shells, is mapped to -1.
+
+    ValueError is raised if the mesh isn't topologically symmetric around seam_edge, or
+    if it's non-manifold.
+    """
+    face_vertices = np.asarray(face_vertices, dtype=np.int64)
+    if vertex_count is None:
+        vertex_count = int(face_vertices.max()) + 1 if len(face_vertices) else 0
+    half_edges, faces = half_edge_map(counts, face_vertices)
+
+    a, b = seam_edge
+    if (a, b) not in half_edges or (b, a) not in half_edges:
+        raise ValueError('The seam edge %i-%i must have a face on each side' % (a, b))
+
+    vertex_map = [-1] * vertex_count
+    face_map = [-1] * len(faces)
+
+    def map_vertex(vertex, mirrored):
+        for v1, v2 in ((vertex, mirrored), (mirrored, vertex)):
+            if vertex_map[v1] == -1:
+                vertex_map[v1] = v2
+            elif vertex_map[v1] != v2:
+                raise ValueError('The mesh isn\'t topologically symmetric at vertex %i' % v1)
+
+    # Each queue entry is a pair of mirrored faces, with the position in each face of a
+    # pair of mirrored vertices.  Mirroring reverses winding, so walking forwards around
+    # one face corresponds to walking backwards around the other.
+    #
+    # The seam edge's vertices are on the plane of symmetry, so they mirror to themselves.
+    # Face f1 has a -> b and f2 has b -> a, so a is one past b in f2.
+    f1, pos1 = half_edges[(a, b)]
+    f2, pos2 = half_edges[(b, a)]
+    queue = deque([(f1, pos1, f2, (pos2 + 1) % len(faces[f2]))])
+
+    while queue:
+        f1, pos1, f2, pos2 = queue.popleft()
+        if face_map[f1] != -1 or face_map[f2] != -1:
+            if face_map[f1] != f2 or face_map[f2] != f1:
+                raise ValueError('The mesh isn\'t topologically symmetric at face %i' % f1)
+            continue
+
+        face1, face2 = faces[f1], faces[f2]
+        count = len(face1)
+        if len(face2) != count:
+            raise ValueError('The mesh isn\'t topologically symmetric: face %i has %i vertices, but its mirror face %i has %i' %
+                    (f1, count, f2, len(face2)))
+
+        face_map[f1] = f2
+        face_map[f2] = f1
+
+        mirrored = [face2[(pos2 - step) % count] for step in range(count)]
+        for step in range(count):
+            map_vertex(face1[(pos1 + step) % count], mirrored[step])
+
+        # Queue the faces across each edge.  The edge u -> v in face1 mirrors to mv -> mu
+        # in face2, so the neighbor of face1 has v -> u and the neighbor of face2 has
+        # mu -> mv.
+        for step in range(count):
+            u, v = face1[(pos1 + step) % count], face1[(pos1 + step + 1) % count]
+            mu, mv = mirrored[step], mirrored[(step + 1) % count]
+            neighbor1 = half_edges.get((v, u))
+            neighbor2 = half_edges.get((mu, mv))
+            if neighbor1 is None and neighbor2 is None:
+                # Both edges are borders.
+                continue
+            if neighbor1 is None or neighbor2 is None:
+                raise ValueError('The mesh isn\'t topologically symmetric at edge %i-%i' % (u, v))
+
+            n1, n1_pos = neighbor1
+            n2, n2_pos = neighbor2
+            if face_map[n1] == -1 or face_map[n2] == -1:
+                # v is at n1_pos in neighbor1, and mv is one past mu in neighbor2.
+                queue.append((n1, n1_pos, n2, (n2_pos + 1) % len(faces[n2])))
+
+    # Map edges through their vertices.
+    if edges is None:
+        edges = mesh_edges(counts, face_vertices)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    vertex_map = np.array(vertex_map, dtype=np.int64)
+
+    edge_keys = _edge_keys(edges[:, 0], edges[:, 1], vertex_count)
+    edge_order = np.argsort(edge_keys)
+    sorted_keys = edge_keys[edge_order]
+
+    mirrored_vertices = vertex_map[edges]
+    has_mapping = (mirrored_vertices >= 0).all(axis=1)
+    mirrored_keys = _edge_keys(mirrored_vertices[:, 0], mirrored_vertices[:, 1], vertex_count)
+    found = np.minimum(np.searchsorted(sorted_keys, mirrored_keys), max(len(sorted_keys) - 1, 0))
+    missing = has_mapping & (sorted_keys[found] != mirrored_keys)
+    if missing.any():
+        v1, v2 = edges[np.argmax(missing)].tolist()
+        raise ValueError('The mesh isn\'t topologically symmetric at edge %i-%i' % (v1, v2))
+
+    edge_map = np.where(has_mapping, edge_order[found], -1)
+
+    return (np.array(vertex_map, dtype=np.int32),
+            np.array(edge_map, dtype=np.int32),
+            np.array(face_map, dtype=np.int32))
@@ -0,0 +1,223 @@
+"""
+Give a mesh the vertex order of another mesh with the same topology.
+
+Meshes that come back from other applications often have the right topology with their
+vertices renumbered.  This matches the two meshes from their connectivity, starting at
+one pair of corresponding faces, and then rebuilds the destination mesh with the
+source's vertex and face order, keeping its own shape, UVs, hard edges, creases and
+color sets.  Anything else stored per component, like locked normals, is lost.
+
+To use from the menu, select a face and one of its vertices on the source mesh, then
+a face and its matching vertex on the destination mesh.  The source is whichever mesh
+was selected first.  This can't be undone, and clears the undo queue.
+"""
+
+import numpy as np
+from pymel import core as pm
+from maya import cmds
+import maya.api.OpenMaya as om
+from zMayaTools import maya_logging, mesh_io, vertex_mapping
+
+log = maya_logging.get_log()
+
+def _reorder_uvs(mesh_fn, dst_counts, corner_map, src_counts):
+    # Return {uv_set: (u, v, uv_counts, uv_ids)} for each UV set on the destination mesh,
+    # with UV assignments in the source's face vertex order.
+    src_face = np.repeat(np.arange(len(src_counts)), src_counts)
+
+    uv_sets = {}
+    for uv_set in mesh_fn.getUVSetNames():
+        u, v = mesh_fn.getUVs(uv_set)
+        uv_counts, uv_ids = mesh_fn.getAssignedUVs(uv_set)
+        uv_counts = np.array(uv_counts, dtype=np.int64)
+
+        # Faces either have a UV on every vertex or none.  Spread the assignments out to
+        # one per face vertex, with -1 on faces without UVs.
+        corner_uvs = np.full(int(dst_counts.sum()), -1, dtype=np.int64)
+        has_uvs = uv_counts > 0
+        has_uvs_corner = np.repeat(has_uvs, dst_counts)
+        corner_uvs[has_uvs_corner] = np.array(uv_ids, dtype=np.int64)
+
+        # Reorder them, and collect them back into faces.
+        corner_uvs = corner_uvs[corner_map]
+        src_has_uvs = np.ones(len(src_counts), dtype=bool)
+        np.logical_and.at(src_has_uvs, src_face, corner_uvs >= 0)
+        new_counts = np.where(src_has_uvs, src_counts, 0)
+        new_ids = corner_uvs[np.repeat(src_has_uvs, src_counts)]
+        uv_sets[uv_set] = (u, v, new_counts.tolist(), new_ids.tolist())
+
+    return uv_sets
+
+def _reorder_colors(mesh_fn, corner_map):
+    # Return {color_set: (colors, clamped, representation, assigned)} for each color set
+    # on the destination mesh, with colors in the source's face vertex order.  assigned
+    # is a bool array of which face vertices have a color.
+    color_sets = {}
+    for color_set in mesh_fn.getColorSetNames():
+        colors = np.array([tuple(color) for color in mesh_fn.getFaceVertexColors(color_set)], dtype=np.float64).reshape(-1, 4)
+        colors = colors[corner_map]
+
+        # Face vertices without a color are returned as (-1, -1, -1, -1).
+        assigned = (colors != -1).any(axis=1)
+        color_sets[color_set] = (colors, mesh_fn.isColorClamped(color_set),
+                mesh_fn.getColorRepresentation(color_set), assigned)
+
+    return color_sets
+
+def _get_creases(get_creases):
+    # Return (ids, creases) from getCreaseEdges or getCreaseVertices, which raise
+    # RuntimeError on some versions if there are no creases.
+    try:
+        ids, creases = get_creases()
+    except RuntimeError:
+        return np.zeros(0, dtype=np.int64), []
+    return np.array(ids, dtype=np.int64), list(creases)
+
+def _match_edges(edges, new_edges):
+    # Return the index in new_edges of each edge in edges.  Both are (E, 2) arrays of
+    # vertex pairs, in either order.
+    edges = np.sort(edges, axis=1).astype(np.int64)
+    new_edges = np.sort(new_edges, axis=1).astype(np.int64)
+    vertex_count = int(max(edges.max(), new_edges.max())) + 1
+    keys = edges[:, 0] * vertex_count + edges[:, 1]
+    new_keys = new_edges[:, 0] * vertex_count + new_edges[:, 1]
+    order = np.argsort(new_keys)
+    return order[np.searchsorted(new_keys, keys, sorter=order)]
+
+def transfer_vertex_order(src_shape, dst_shape, seed_faces, seed_vertices):
+    """
+    Rebuild dst_shape with the vertex and face order of src_shape.
+
+    seed_faces and seed_vertices give one corresponding face and vertex on each mesh,
+    as with vertex_mapping.make_topological_vertex_map.
+
+    UVs, edge smoothing, edge and vertex creases and color sets are carried over to the
+    new order.  Other per-component data, like locked normals, is lost.
+
+    The mesh is rewritten in one operation with MFnMesh.createInPlace, which can't be
+    undone.  Undoing earlier commands would replay them against the new topology, so
+    the undo queue is flushed.  dst_shape can't have construction history, since its
+    output would be replaced by its input again on the next evaluation.
+    """
+    if cmds.listConnections('%s.inMesh' % dst_shape, s=True, d=False):
+        raise ValueError('%s has construction history.  Delete its history first.' % dst_shape)
+
+    vertex_map, face_map, corner_map = vertex_mapping.make_topological_vertex_map(src_shape, dst_shape, seed_faces, seed_vertices)
+    src_counts, src_face_vertices = mesh_io.get_topology(src_shape)
+    dst_counts, dst_face_vertices = mesh_io.get_topology(dst_shape)
+    dst_points = mesh_io.get_points(dst_shape, world_space=False)
+
+    if len(vertex_map) != len(dst_points) or (vertex_map < 0).any() or (face_map < 0).any():
+        raise ValueError('Not all of %s is connected to the selected face.  Each mesh shell needs to match.' % src_shape)
+
+    mesh_fn = mesh_io.get_mesh_fn(dst_shape)
+    uv_sets = _reorder_uvs(mesh_fn, dst_counts, corner_map, src_counts)
+    color_sets = _reorder_colors(mesh_fn, corner_map)
+    current_color_set = mesh_fn.currentColorSetName()
+
+    # Edges are renumbered by the rebuild, so remember them by their vertices in the new
+    # order, and find them again afterwards.  Vertex i of the new mesh is vertex_map[i].
+    new_vertex = np.empty(len(vertex_map), dtype=np.int64)
+    new_vertex[vertex_map] = np.arange(len(vertex_map))
+    edges = new_vertex[mesh_io.get_edges(dst_shape)]
+    edge_smoothing = mesh_io.get_edge_smoothing(dst_shape)
+    crease_edge_ids, edge_creases = _get_creases(mesh_fn.getCreaseEdges)
+    crease_vertex_ids, vertex_creases = _get_creases(mesh_fn.getCreaseVertices)
+
+    # The source's vertex and face order, with the destination's positions.
+    points = om.MPointArray([om.MPoint(point) for point in dst_points[vertex_map].tolist()])
+    mesh_fn.createInPlace(points, src_counts.tolist(), src_face_vertices.tolist())
+
+    existing_uv_sets = mesh_fn.getUVSetNames()
+    for uv_set, (u, v, uv_counts, uv_ids) in uv_sets.items():
+        if uv_set not in existing_uv_sets:
+            mesh_fn.createUVSet(uv_set)
+        mesh_fn.setUVs(u, v, uv_set)
+        mesh_fn.assignUVs(uv_counts, uv_ids, uv_set)
+
+    # Each face vertex of the new mesh is a corner of the source's face list.
+    corner_faces = np.repeat(np.arange(len(src_counts)), src_counts)
+    existing_color_sets = mesh_fn.getColorSetNames()
+    for color_set, (colors, clamped, representation, assigned) in color_sets.items():
+        if color_set not in existing_color_sets:
+            mesh_fn.createColorSet(color_set, clamped, representation)
+        mesh_fn.setCurrentColorSetName(color_set)
+        mesh_fn.setFaceVertexColors(om.MColorArray([om.MColor(color) for color in colors[assigned].tolist()]),
+                corner_faces[assigned].tolist(), src_face_vertices[assigned].tolist(), None, representation)
+    if current_color_set:
+        mesh_fn.setCurrentColorSetName(current_color_set)
+
+    mesh_fn.updateSurface()
+
+    edge_map = _match_edges(edges, mesh_io.get_edges(dst_shape))
+    mesh_fn.setEdgeSmoothings(edge_map.tolist(), edge_smoothing.tolist())
+    mesh_fn.cleanupEdgeSmoothing()
+    if len(crease_edge_ids):
+        mesh_fn.setCreaseEdges(edge_map[crease_edge_ids].tolist(), edge_creases)
+    if len(crease_vertex_ids):
+        mesh_fn.setCreaseVertices(new_vertex[crease_vertex_ids].tolist(), vertex_creases)
+
+    mesh_fn.updateSurface()
+
+    cmds.flushUndo()
+
+def _selected_seeds():
+    # Return (src_shape, dst_shape, seed_faces, seed_vertices) from the selection, or
+    # None if the selection isn't a face and vertex on each of two meshes.  The source
+    # is the mesh of the first selected component, so this needs selection order.
+    meshes = []
+    faces = {}
+    vertices = {}
+    for component in pm.ls(os=True, fl=True):
+        if isinstance(component, pm.MeshFace):
+            components = faces
+        elif isinstance(component, pm.MeshVertex):
+            components = vertices
+        else:
+            return None
+
+        shape = component.node()
+        if shape not in meshes:
+            meshes.append(shape)
+        components.setdefault(shape, []).append(component.index())
+
+    if len(meshes) != 2:
+        return None
+    for shape in meshes:
+        if len(faces.get(shape, [])) != 1 or len(vertices.get(shape, [])) != 1:
+            return None
+
+    src_shape, dst_shape = meshes
+    return (src_shape.name(), dst_shape.name(),
+            (faces[src_shape][0], faces[dst_shape][0]),
+            (vertices[src_shape][0], vertices[dst_shape][0]))
+
+def run():
+    # Component selection order is only recorded with trackSelectionOrder.  Without it,
+    # we can't tell which mesh is the source, so turn it on and have the user reselect.
+    if not cmds.selectPref(q=True, trackSelectionOrder=True):
+        cmds.selectPref(trackSelectionOrder=True)
+        log.warning('Selection order tracking was off, and has been turned on.  Select the source face and vertex, then the destination face and vertex again.')
+        return
+
+    seeds = _selected_seeds()
+    if seeds is None:
+        log.warning('Select a face and one of its vertices on the source mesh, then a face and its matching vertex on the destination mesh.')
+        return
+
+    src_shape, dst_shape = seeds[0:2]
+    result = pm.confirmDialog(title='Transfer Vertex Order',
+            message='Reorder %s to match %s?\n\n'
+                'UVs, hard edges, creases and color sets are kept, but locked normals and other per-component '
+                'data will be lost.  This can\'t be undone, and will clear the undo queue.' % (dst_shape, src_shape),
+            button=['Reorder', 'Cancel'], defaultButton='Reorder', cancelButton='Cancel', dismissString='Cancel')
+    if result != 'Reorder':
+        return
+
+    try:
+        transfer_vertex_order(*seeds)
+    except ValueError as e:
+        log.error(str(e))
+        return
+
+    log.warning('Transferred vertex order from %s to %s.  The undo queue has been cleared.' % (src_shape, dst_shape))
@@ -0,0 +1,281 @@
+"""
+Closest points on a triangle mesh.
+
+TriangleBVH is a bounding volume hierarchy over a mesh's triangles.  Its query finds
+the closest point on the surface to each of a list of points, returning the face it's
+on and its barycentric weights, so values can be interpolated across faces instead of
+copied from the nearest vertex:
+
+bvh = triangle_bvh.TriangleBVH(vertices, triangles)
+faces, triangle_vertices, weights, distances = bvh.query(points)
+values_at_points = triangle_bvh.interpolate(values, triangle_vertices, weights)
+
+As with kdtree, distances are squared.
+"""
+
+import numpy as np
+
+from zMayaTools import kdtree
+
+def triangulate(counts, face_vertices):
+    """
+    Fan triangulate polygons given as face vertex counts and indices.
+
+    This is only correct for convex polygons.  Inside Maya, mesh_io.get_triangles gives
+    Maya's own triangulation.
+
+    Return (triangles, faces): a (T, 3) array of the vertices of each triangle, and the
+    polygon each triangle came from.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    face_vertices = np.asarray(face_vertices, dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+
+    # Each face with n vertices gives n - 2 triangles: (0, 1, 2), (0, 2, 3) and so on.
+    triangle_counts = np.maximum(counts - 2, 0)
+    faces = np.repeat(np.arange(len(counts)), triangle_counts)
+    first_triangle = np.cumsum(triangle_counts) - triangle_counts
+    corner = np.arange(len(faces)) - first_triangle[faces] + 1
+    start = offsets[faces]
+    triangles = np.column_stack((face_vertices[start], face_vertices[start + corner], face_vertices[start + corner + 1]))
+    return triangles.astype(np.int32), faces.astype(np.int32)
+
+def interpolate(values, triangle_vertices, weights):
+    """
+    Interpolate per-vertex values at points returned by TriangleBVH.query.
+
+    values is an array with one entry (or row) per vertex.
+    """
+    values = np.asarray(values)
+    gathered = values[triangle_vertices]
+    weights = weights.reshape(weights.shape + (1,) * (gathered.ndim - weights.ndim))
+    return (gathered * weights).sum(axis=1)
+
+def closest_points_on_triangles(points, a, b, c):
+    """
+    Find the closest point on each of a list of triangles to each of a list of points.
+
+    All arguments are (N, 3) arrays.  Return (weights, distances): the barycentric
+    weights of the closest point on triangle (a, b, c), and its squared distance.
+
+    This is the region test from Ericson, "Real-Time Collision Detection", done for every
+    triangle at once.
+    """
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+    d1 = (ab * ap).sum(axis=1)
+    d2 = (ac * ap).sum(axis=1)
+    d3 = (ab * bp).sum(axis=1)
+    d4 = (ac * bp).sum(axis=1)
+    d5 = (ab * cp).sum(axis=1)
+    d6 = (ac * cp).sum(axis=1)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    # Compute the weights for each region, then pick the region each point is in.  Weights
+    # for regions a point isn't in may divide by zero, but they're discarded.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = 1 / (va + vb + vc)
+        v = vb * denom
+        w = vc * denom
+        inside = (1 - v - w, v, w)
+
+        t = d1 / (d1 - d3)
+        edge_ab = (1 - t, t, 0)
+        t = d2 / (d2 - d6)
+        edge_ac = (1 - t, 0, t)
+        t = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        edge_bc = (0, 1 - t, t)
+
+    # These are in priority order, since a point on a degenerate triangle can pass more
+    # than one test.
+    regions = [
+        (d1 <= 0) & (d2 <= 0),
+        (d3 >= 0) & (d4 <= d3),
+        (vc <= 0) & (d1 >= 0) & (d3 <= 0),
+        (d6 >= 0) & (d5 <= d6),
+        (vb <= 0) & (d2 >= 0) & (d6 <= 0),
+        (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),
+    ]
+    region_weights = [(1, 0, 0), (0, 1, 0), edge_ab, (0, 0, 1), edge_ac, edge_bc]
+
+    weights = np.empty((len(points), 3))
+    for axis in range(3):
+        weights[:, axis] = np.select(regions, [np.broadcast_to(w[axis], len(points)) for w in region_weights], inside[axis])
+
+    # A degenerate triangle that isn't caught by any of the tests can still give NaNs.
+    # Fall back on its first vertex.
+    degenerate = ~np.isfinite(weights).all(axis=1)
+    weights[degenerate] = (1, 0, 0)
+
+    closest = weights[:, 0:1] * a + weights[:, 1:2] * b + weights[:, 2:3] * c
+    distances = ((closest - points) ** 2).sum(axis=1)
+    return weights, distances
+
+class TriangleBVH(object):
+    """
+    A bounding volume hierarchy over the triangles of a mesh.
+
+    Triangles are ordered by a kd-tree over their centroids, so each node of the
+    hierarchy covers a contiguous range of triangles.  The node for [lo, hi) has the
+    children [lo, mid) and [mid, hi), with mid = (lo + hi) // 2, down to leaves of
+    leaf_size triangles or fewer.
+    """
+
+    def __init__(self, vertices, triangles, faces=None, leaf_size=8):
+        """
+        Create a hierarchy over a triangle mesh.
+
+        vertices is an (N, 3) array of vertex positions and triangles is a (T, 3) array
+        of vertex indices.  If faces is given, it's the face index reported for each
+        triangle, such as the polygon it was triangulated from.  Otherwise, triangles
+        are identified by their position in triangles.
+        """
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        triangles = np.asarray(triangles, dtype=np.int32).reshape(-1, 3)
+        if not len(triangles):
+            raise ValueError('The mesh has no triangles')
+        if faces is None:
+            faces = np.arange(len(triangles), dtype=np.int32)
+        else:
+            faces = np.asarray(faces, dtype=np.int32)
+            if len(faces) != len(triangles):
+                raise ValueError('faces must have one entry for each triangle')
+
+        self.leaf_size = leaf_size
+
+        # Order the triangles spatially.
+        centroids = self.vertices[triangles].mean(axis=1)
+        order = kdtree.ArrayKDTree(centroids, leaf_size=leaf_size).indices
+        self.triangles = triangles[order]
+        self.faces = faces[order]
+        self._corners = [self.vertices[self.triangles[:, corner]] for corner in range(3)]
+
+        self._build_nodes()
+
+        # For the initial search bound: the nearest vertex to a point is on the surface, so
+        # the closest point on a triangle using that vertex is at least that close.
+        used_vertices, vertex_triangle = np.unique(self.triangles.ravel(), return_index=True)
+        self._vertex_triangle = np.zeros(len(self.vertices), dtype=np.int64)
+        self._vertex_triangle[used_vertices] = vertex_triangle // 3
+        self._vertex_tree = kdtree.ArrayKDTree(self.vertices[used_vertices], indices=used_vertices)
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def _build_nodes(self):
+        # Nodes are stored breadth first.  node_lo and node_hi are each node's range of
+        # triangles, node_left is the index of its left child, or -1 for leaves (the right
+        # child always follows the left one), and node_min and node_max are its bounds.
+        tri_min = np.minimum(np.minimum(self._corners[0], self._corners[1]), self._corners[2])
+        tri_max = np.maximum(np.maximum(self._corners[0], self._corners[1]), self._corners[2])
+        count = len(self.triangles)
+
+        node_lo, node_hi, node_left, node_min, node_max = [], [], [], [], []
+        lo = np.array([0])
+        hi = np.array([count])
+        next_node = 1
+        while len(lo):
+            # The ranges on a level are disjoint and sorted, so each range's bounds can be
+            # found with one reduceat over the range boundaries.
+            bounds = np.unique(np.concatenate((lo, hi)))
+            bounds = bounds[bounds < count]
+            segment = np.searchsorted(bounds, lo)
+            node_min.append(np.minimum.reduceat(tri_min, bounds)[segment])
+            node_max.append(np.maximum.reduceat(tri_max, bounds)[segment])
+
+            is_internal = (hi - lo) > self.leaf_size
+            left = np.full(len(lo), -1, dtype=np.int64)
+            left[is_internal] = next_node + 2 * np.arange(is_internal.sum())
+            next_node += 2 * int(is_internal.sum())
+
+            node_lo.append(lo)
+            node_hi.append(hi)
+            node_left.append(left)
+
+            parent_lo, parent_hi = lo[is_internal], hi[is_internal]
+            mid = (parent_lo + parent_hi) // 2
+            lo = np.column_stack((parent_lo, mid)).ravel()
+            hi = np.column_stack((mid, parent_hi)).ravel()
+
+        self.node_lo = np.concatenate(node_lo)
+        self.node_hi = np.concatenate(node_hi)
+        self.node_left = np.concatenate(node_left)
+        self.node_min = np.concatenate(node_min)
+        self.node_max = np.concatenate(node_max)
+
+    def _closest_on(self, points, positions):
+        a, b, c = (corners[positions] for corners in self._corners)
+        return closest_points_on_triangles(points, a, b, c)
+
+    def query(self, points, block_size=4096):
+        """
+        Find the closest point on the mesh to each of a list of points.
+
+        Return (faces, triangle_vertices, weights, distances): the face each closest point
+        is on, an (N, 3) array of the vertices of the triangle it's on, their (N, 3)
+        barycentric weights, and the squared distance to it.  interpolate uses these to
+        sample per-vertex values at the closest points.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        positions = np.zeros(len(points), dtype=np.int64)
+        weights = np.zeros((len(points), 3))
+        distances = np.zeros(len(points))
+
+        for start in range(0, len(points), block_size):
+            end = min(start + block_size, len(points))
+            positions[start:end], weights[start:end], distances[start:end] = self._query_block(points[start:end])
+
+        return self.faces[positions], self.triangles[positions], weights, distances
+
+    def _query_block(self, queries):
+        # Start with the closest point on a triangle touching the nearest vertex.  This is
+        # usually close to the answer, so most nodes are pruned straight away.
+        nearest_vertex, _ = self._vertex_tree.query(queries)
+        best_pos = self._vertex_triangle[nearest_vertex]
+        best_weights, best_dist = self._closest_on(queries, best_pos)
+
+        # Descend the hierarchy one level at a time for every query together.  Each entry
+        # of the frontier is a (query, node) pair that might hold a closer point.
+        rows = np.arange(len(queries))
+        nodes = np.zeros(len(queries), dtype=np.int64)
+        while len(rows):
+            # Discard nodes whose bounds are farther away than the best point so far.
+            p = queries[rows]
+            gap = np.maximum(np.maximum(self.node_min[nodes] - p, p - self.node_max[nodes]), 0)
+            keep = (gap ** 2).sum(axis=1) < best_dist[rows]
+            rows, nodes = rows[keep], nodes[keep]
+
+            # Test every triangle in the leaves.
+            at_leaf = self.node_left[nodes] < 0
+            leaf_rows, leaf_nodes = rows[at_leaf], nodes[at_leaf]
+            lo, hi = self.node_lo[leaf_nodes], self.node_hi[leaf_nodes]
+            for offset in range(self.leaf_size):
+                has_triangle = lo + offset < hi
+                if not has_triangle.any():
+                    break
+                test_rows = leaf_rows[has_triangle]
+                test_pos = lo[has_triangle] + offset
+                test_weights, test_dist = self._closest_on(queries[test_rows], test_pos)
+
+                # A query may be testing triangles in more than one leaf.  Keep only its
+                # closest result before comparing against the best so far.
+                order = np.lexsort((test_dist, test_rows))
+                first = order[np.unique(test_rows[order], return_index=True)[1]]
+                better = first[test_dist[first] < best_dist[test_rows[first]]]
+                best_rows = test_rows[better]
+                best_dist[best_rows] = test_dist[better]
+                best_pos[best_rows] = test_pos[better]
+                best_weights[best_rows] = test_weights[better]
+
+            # Descend into both children of the other nodes.
+            rows, nodes = rows[~at_leaf], nodes[~at_leaf]
+            left = self.node_left[nodes]
+            rows = np.repeat(rows, 2)
+            nodes = np.column_stack((left, left + 1)).ravel()
+
+        return best_pos, best_weights, best_dist
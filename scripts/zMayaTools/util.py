@@ -4,6 +4,12 @@ def scale(x, l1, h1, l2, h2):
     """
     return (x - l1) * (h2 - l2) / (h1 - l1) + l2
 
+class CancelledException(Exception):
+    """
+    This is raised by ProgressWindow.check_cancellation when the user cancels.
+    """
+    pass
+
 class ProgressWindow(object):
     def __init__(self, total_progress_values=10, title=''):
         self._cancel = False
@@ -42,6 +48,16 @@ class ProgressWindow(object):
         # Check for cancellation when we update progress.
         self.check_cancellation()
 
+    def set_task_progress(self, label, percent=None, force=False):
+        """
+        Report progress within the current task, from 0 to 1.
+
+        This is for long tasks that want to report progress without advancing the main
+        progress bar.
+        """
+        # Check for cancellation when we update progress.
+        self.check_cancellation()
+
     def __enter__(self, *args, **kwargs):
         return self
 
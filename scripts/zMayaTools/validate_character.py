@@ -6,6 +6,15 @@ from maya import OpenMaya as om
 from zMayaTools import maya_helpers, maya_logging
 log = maya_logging.get_log()
 
+try:
+    import numpy as np
+except ImportError:
+    # Maya 2020 and earlier don't come with numpy.  Without it, meshes are checked with
+    # slower pure Python code.
+    np = None
+else:
+    from zMayaTools import mesh_io
+
 # This runs a number of sanity checks.  It's intended to be used against character meshes
 # that are symmetric across the YZ plane.
 #
@@ -53,6 +62,21 @@ log = maya_logging.get_log()
 # XXX: Add a way to silence warnings by adding an attribute to meshes.
 
 def get_vertices(mesh):
+    """
+    Return the world space vertex positions of mesh.
+
+    This is an (N, 3) array if numpy is available, otherwise a list of (x, y, z) tuples.
+    """
+    if np is None:
+        return _get_vertices_python(mesh)
+
+    # Pymel's getPoints is frighteningly slow, so read the points directly.
+    points = mesh_io.get_points(mesh)
+    if not len(points):
+        log.warning('Warning: mesh %s has no vertices', mesh.nodeName())
+    return points
+
+def _get_vertices_python(mesh):
     # Meshes with no data can either crash during pm.xform or raise an exception.
     try:
         if not len(mesh.vtx):
@@ -63,12 +87,15 @@ def get_vertices(mesh):
         return []
 
     # Pymel's getPoints is frighteningly slow, so we use pm.xform instead.
-    points = pm.xform(mesh.vtx, q=True, ws=True, t=True)    
-    points = [(x, y, z) for x, y, z, in zip(points[0::3], points[1::3], points[2::3])]
+    points = pm.xform(mesh.vtx, q=True, ws=True, t=True)
+    return [(x, y, z) for x, y, z, in zip(points[0::3], points[1::3], points[2::3])]
 
-    # This is convenient, but slow.
-#    points = [om.MPoint(x, y, z) for x, y, z, in zip(points[0::3], points[1::3], points[2::3])]
-    return points
+def _find_vertices(vertices, test):
+    # Return the indices of vertices from get_vertices whose X coordinate passes test.
+    # test is called with an array of X coordinates with numpy, or one at a time without.
+    if np is not None:
+        return np.flatnonzero(test(vertices[:, 0])).tolist()
+    return [idx for idx, vert in enumerate(vertices) if test(vert[0])]
 
 def format_pos(pos):
     return '%.4f %.4f %.4f' % (pos[0], pos[1], pos[2])
@@ -108,27 +135,28 @@ class Validate(object):
                 nodes=[self.node])
             return
 
-        def get_distance(p1, p2):
-            x = p1[0] - p2[0]
-            y = p1[1] - p2[1]
-            z = p1[2] - p2[2]
-            return math.pow(x*x+y*y+z*z, .5)
-
         # Count the number of vertices that are in a different place in the output mesh than the input mesh
         # by different levels of error.
-        vtxs_0001 = []
-        vtxs_001 = []
-        vtxs_01 = []
-        cnt_0001 = 0
-        cnt_001 = 0
-        cnt_01 = 0
-        for idx in xrange(len(base_points)):
-            p1 = base_points[idx]
-            p2 = output_points[idx]
-            distance = get_distance(p1, p2)
-            if     distance > 0.01:    vtxs_01.append(idx)
-            elif  distance > 0.001:   vtxs_001.append(idx)
-            elif distance > 0.0001:  vtxs_0001.append(idx)
+        if np is not None:
+            distance = np.sqrt(((base_points - output_points) ** 2).sum(axis=1))
+            vtxs_01 = np.flatnonzero(distance > 0.01).tolist()
+            vtxs_001 = np.flatnonzero((distance > 0.001) & (distance <= 0.01)).tolist()
+            vtxs_0001 = np.flatnonzero((distance > 0.0001) & (distance <= 0.001)).tolist()
+        else:
+            def get_distance(p1, p2):
+                x = p1[0] - p2[0]
+                y = p1[1] - p2[1]
+                z = p1[2] - p2[2]
+                return math.pow(x*x+y*y+z*z, .5)
+
+            vtxs_0001 = []
+            vtxs_001 = []
+            vtxs_01 = []
+            for idx in xrange(len(base_points)):
+                distance = get_distance(base_points[idx], output_points[idx])
+                if     distance > 0.01:    vtxs_01.append(idx)
+                elif  distance > 0.001:   vtxs_001.append(idx)
+                elif distance > 0.0001:  vtxs_0001.append(idx)
 
         vertices = str(self.node.getShape())
 
@@ -290,10 +318,7 @@ class Validate(object):
 
     def check_topological_symmetry(self, shape, vertices):
         # We expect the mesh to be symmetric across the YZ plane.  Find vertices along it.
-        vertices_on_symmetry_plane = []
-        for idx, vert in enumerate(vertices):
-            if abs(vert[0]) < 0.001:
-                vertices_on_symmetry_plane.append(idx)
+        vertices_on_symmetry_plane = _find_vertices(vertices, lambda x: abs(x) < 0.001)
 
         if not vertices_on_symmetry_plane:
             self.log('Mesh isn\'t topologically symmetric (no vertices found on the YZ plane)', nodes=[self.node])
@@ -330,10 +355,7 @@ class Validate(object):
         Check if a mesh is symmetric around YZ.
         """
         # Find all vertices that are on -X, or on the YZ plane.
-        indices = []
-        for idx, vert in enumerate(vertices):
-            if vert[0] < 0.0001:
-                indices.append(idx)
+        indices = _find_vertices(vertices, lambda x: x < 0.0001)
 
         # Select those vertices with symmetry, so we also select symmetric vertices.
         verts = ['%s.vtx[%i]' % (shape.name(), idx) for idx in indices]
@@ -1,61 +1,202 @@
-from pymel import core as pm
+import hashlib, math, multiprocessing
+import numpy as np
 from maya import cmds
-from zMayaTools import kdtree
+from zMayaTools import hash_grid, kdtree, mesh_io, subdivision_mapping, topological_mapping, topological_symmetry, triangle_bvh
 
-class PointWithIndex(object):
+def _match_radius(threshold):
     """
-    A helper for storing vertex indices along with vertices in kdtree.
+    Return the search radius for a matching threshold.
+
+    The threshold has always been compared against the squared distances returned by
+    kdtree, so the actual radius is its square root.
+    """
+    return math.sqrt(threshold)
+
+_axes = {'x': 0, 'y': 1, 'z': 2}
+
+# If this is set to a kdtree_cache.TreeCache, trees built for mapping are cached on disk
+# by their points, so mapping or mirroring the same mesh again loads them instead of
+# building them.  This is off by default, since it writes to disk: a default TreeCache()
+# stores trees in zMayaTools/kdtree_cache under the temp directory, and keeps up to 512MB.
+tree_cache = None
+
+def _make_tree(points, indices=None):
+    if tree_cache is None:
+        return kdtree.ArrayKDTree(points, indices=indices)
+    return tree_cache.get_tree(points, indices=indices)
+
+# The number of destination vertices to map at a time in the iter_* functions.  This is
+# small enough to report progress and check for cancellation every fraction of a second.
+default_chunk_size = 65536
+
+def _collect_chunks(chunks, total, index_mapping, index_distances, progress):
     """
+    Fill in index_mapping and index_distances from an iter_* generator.
 
-    def __init__(self, point, idx):
-        self.coords = point
-        self.idx = idx
+    If progress is a util.ProgressWindow, report progress after each chunk.  This also
+    checks for cancellation, raising util.CancelledException if the user cancelled.
+    """
+    done = 0
+    for dst_indices, src_indices, distances in chunks:
+        index_mapping[dst_indices] = src_indices
+        index_distances[dst_indices] = distances
+        done += len(dst_indices)
+        if progress is not None:
+            progress.set_task_progress('Mapping vertices', percent=float(done) / max(total, 1))
+    return index_mapping, index_distances
 
-    def __len__(self):
-        return len(self.coords)
+def symmetry_plane(axis_of_symmetry=0, plane_point=(0, 0, 0), plane_normal=None):
+    """
+    Return (normal, point) for a plane of symmetry.
 
-    def __getitem__(self, i):
-        return self.coords[i]
+    If plane_normal is None, the plane is perpendicular to axis_of_symmetry, which is
+    an axis index or 'x', 'y' or 'z'.  Otherwise, plane_normal is its normal, which
+    doesn't need to be normalized.  plane_point is any point on the plane.
+    """
+    if plane_normal is None:
+        axis_of_symmetry = _axes.get(axis_of_symmetry, axis_of_symmetry)
+        plane_normal = np.zeros(3)
+        plane_normal[axis_of_symmetry] = 1
 
-    def __repr__(self):
-        return 'Item({}, {}, {})'.format(self.coords[0], self.coords[1], self.idx)
+    normal = np.asarray(plane_normal, dtype=np.float64).reshape(3)
+    length = np.sqrt((normal ** 2).sum())
+    if length == 0:
+        raise ValueError('plane_normal can\'t be zero')
+    return normal / length, np.asarray(plane_point, dtype=np.float64).reshape(3)
 
-def make_vertex_symmetry_map(shape, threshold=0.01, axis_of_symmetry='x', positive_to_negative=True):
+def reflect_points(points, normal, point):
+    """
+    Reflect an (N, 3) array of points across the plane through point with the given
+    unit normal.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    distances = (points - point).dot(normal)
+    return points - np.outer(distances * 2, normal)
+
+def _split_sides(vertices, normal, point, positive_to_negative):
+    """
+    Return (dst_indices, src_side_indices), the vertices on the destination side of the
+    plane and the rest.  Vertices on the plane of symmetry are sources, and can be
+    matched by vertices on either side.
+    """
+    side = (vertices - point).dot(normal)
+    if positive_to_negative:
+        is_destination_vertex = side < -0.0001
+    else:
+        is_destination_vertex = side > +0.0001
+    return np.flatnonzero(is_destination_vertex), np.flatnonzero(~is_destination_vertex)
+
+def _radius_search(points, radius, indices=None, progress=None, processes=0):
+    """
+    Build the search structure for matching points within radius, as with
+    hash_grid.radius_search.
+
+    Building a tree for a large mesh can take a while, so if progress is given, this is
+    reported and cancellation is checked before and after the build.
+    """
+    if progress is not None:
+        progress.set_task_progress('Building search structure', percent=0, force=True)
+    search = hash_grid.radius_search(points, radius, indices=indices, tree_cache=tree_cache, processes=processes)
+    if progress is not None:
+        progress.check_cancellation()
+    return search
+
+def _iter_symmetry_chunks(vertices, normal, point, dst_indices, search, radius, chunk_size):
+    # Find the mirrored position of each vertex on the destination side, and look them
+    # up a chunk at a time.
+    for start in range(0, len(dst_indices), chunk_size):
+        chunk = dst_indices[start:start+chunk_size]
+        mirrored = reflect_points(vertices[chunk], normal, point)
+        src_indices, distances = search.query_within(mirrored, radius)
+        yield chunk, src_indices, np.sqrt(distances).astype(np.float32)
+
+def iter_symmetry_map_points(vertices, threshold=0.01, axis_of_symmetry=0, positive_to_negative=True,
+        plane_point=(0, 0, 0), plane_normal=None, chunk_size=default_chunk_size):
+    """
+    Make a symmetry map for an (N, 3) array of points a chunk at a time.
+
+    The arguments are the same as symmetry_map_points.  This yields
+    (dst_indices, src_indices, distances) for each chunk of up to chunk_size vertices
+    on the destination side.  Vertices that aren't on the destination side map to
+    themselves, and aren't included.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    normal, point = symmetry_plane(axis_of_symmetry, plane_point, plane_normal)
+    dst_indices, src_side_indices = _split_sides(vertices, normal, point, positive_to_negative)
+
+    # Search only the source side, so mirrored vertices can never match another
+    # destination vertex.
+    radius = _match_radius(threshold)
+    search = _radius_search(vertices[src_side_indices], radius, indices=src_side_indices)
+    for chunk in _iter_symmetry_chunks(vertices, normal, point, dst_indices, search, radius, chunk_size):
+        yield chunk
+
+def symmetry_map_points(vertices, threshold=0.01, axis_of_symmetry=0, positive_to_negative=True,
+        plane_point=(0, 0, 0), plane_normal=None, progress=None):
+    """
+    Make a symmetry map for an (N, 3) array of points.
+
+    This is make_vertex_symmetry_map_array for points that have already been read.  The
+    plane of symmetry is given as with symmetry_plane.  The positive side of the plane
+    is the side its normal points towards.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    normal, point = symmetry_plane(axis_of_symmetry, plane_point, plane_normal)
+    dst_indices, src_side_indices = _split_sides(vertices, normal, point, positive_to_negative)
+
+    radius = _match_radius(threshold)
+    search = _radius_search(vertices[src_side_indices], radius, indices=src_side_indices, progress=progress)
+    chunks = _iter_symmetry_chunks(vertices, normal, point, dst_indices, search, radius, default_chunk_size)
+
+    # Vertices on the source side map to themselves.
+    index_mapping = np.arange(len(vertices), dtype=np.int32)
+    index_distances = np.zeros(len(vertices), dtype=np.float32)
+    return _collect_chunks(chunks, len(dst_indices), index_mapping, index_distances, progress)
+
+def make_vertex_symmetry_map_array(shape, threshold=0.01, axis_of_symmetry='x', positive_to_negative=True,
+        plane_point=(0, 0, 0), plane_normal=None, local_space=False, progress=None):
     """
     Given a shape, make a mapping from vertices on one side to matching vertices on the
     other side.
 
-    Return a map of {dst: src} vertex indices and a list of target vertices that weren't matched.
+    By default, the mesh is mirrored across the world space plane through the origin
+    perpendicular to axis_of_symmetry.  plane_point and plane_normal can give any other
+    plane, as with symmetry_plane.  If local_space is true, the plane is in the object's
+    local space instead of world space, so a moved or rotated mesh is still mirrored
+    across its own axes.
+
+    Return (indices, distances), an int32 array of the source vertex for each vertex and
+    a float32 array of the distance to it.  Unmatched destination vertices have an index
+    of -1 and an infinite distance.  Vertices on the source side and on the plane of
+    symmetry map to themselves, so values[indices] mirrors a per-vertex array wherever
+    there's a match.
+
+    If progress is a util.ProgressWindow, progress is reported with set_task_progress,
+    and util.CancelledException is raised if the user cancels.
     """
-    axes = {'x': 0, 'y': 1, 'z': 2}
-    axis_of_symmetry = axes[axis_of_symmetry]
-    
-    vertices = cmds.xform('%s.vtx[*]' % shape, q=True, ws=True, t=True)
-    vertices = [(x, y, z) for x, y, z in zip(vertices[0::3], vertices[1::3], vertices[2::3])]
-    vertices = [PointWithIndex(vtx, idx) for idx, vtx in enumerate(vertices)]
+    vertices = mesh_io.get_points(shape, world_space=not local_space)
+    return symmetry_map_points(vertices, threshold, axis_of_symmetry, positive_to_negative,
+            plane_point, plane_normal, progress=progress)
 
-    def is_destination_vertex(idx):
-        if positive_to_negative and p[axis_of_symmetry] >= -0.0001:
-            return False
-        if not positive_to_negative and p[axis_of_symmetry] <= +0.0001:
-            return False
-        return True
+def make_vertex_symmetry_map(shape, threshold=0.01, axis_of_symmetry='x', positive_to_negative=True,
+        plane_point=(0, 0, 0), plane_normal=None, local_space=False, progress=None):
+    """
+    Given a shape, make a mapping from vertices on one side to matching vertices on the
+    other side.  The plane of symmetry and progress are as with make_vertex_symmetry_map_array.
 
-    # Make a tree of the vertex positions.
-    tree = kdtree.create(vertices)
+    Return a map of {dst: src} vertex indices and a list of target vertices that weren't matched.
+    """
+    src_indices, distances = make_vertex_symmetry_map_array(shape, threshold, axis_of_symmetry, positive_to_negative,
+            plane_point, plane_normal, local_space, progress)
 
     index_mapping = {}
     unmapped_dst_vertices = set()
-    for dst_idx, p in enumerate(vertices):
-        # If this vertex is on the wrong side, skip it.
-        if not is_destination_vertex(dst_idx):
+    for dst_idx, src_idx in enumerate(src_indices.tolist()):
+        if src_idx == dst_idx:
+            # This vertex isn't on the destination side.
             continue
-            
-        p = (-p[0], p[1], p[2])
-        node, distance = tree.search_nn(p)
-        src_idx = node.data.idx
 
-        if distance > threshold:
+        if src_idx == -1:
             # We don't have a match.  Remember that this vertex was unmatched.
             unmapped_dst_vertices.add(dst_idx)
         else:
@@ -63,32 +204,371 @@ def make_vertex_symmetry_map(shape, threshold=0.01, axis_of_symmetry='x', positi
             
     return index_mapping, unmapped_dst_vertices
     
-def make_vertex_map(src_shape, dst_shape, threshold=0.01):
+# Symmetry maps computed this session, as {shape uuid: (key, indices)}.  Only the most
+# recent map for each shape is kept.
+_symmetry_map_cache = {}
+
+# The attributes get_symmetry_map stores maps in when store_on_mesh is true.
+_symmetry_map_attr = 'zSymmetryMap'
+_symmetry_map_key_attr = 'zSymmetryMapKey'
+
+def _symmetry_map_key(vertices, counts, face_vertices, options):
+    """
+    Return a key identifying a symmetry map.
+
+    This changes if the mesh's topology, its base points or the symmetry options change.
+    """
+    key = hashlib.sha1()
+    key.update(repr(options).encode('ascii'))
+    for array in (counts, face_vertices, vertices):
+        key.update(('%s' % (array.shape,)).encode('ascii'))
+        key.update(np.ascontiguousarray(array).tobytes())
+    return key.hexdigest()
+
+def _load_stored_symmetry_map(shape, key, vertex_count):
+    if not cmds.attributeQuery(_symmetry_map_key_attr, node=shape, exists=True):
+        return None
+    if cmds.getAttr('%s.%s' % (shape, _symmetry_map_key_attr)) != key:
+        return None
+
+    indices = np.array(cmds.getAttr('%s.%s' % (shape, _symmetry_map_attr)) or [], dtype=np.int32)
+    if len(indices) != vertex_count:
+        return None
+    return indices
+
+def _store_symmetry_map(shape, key, indices):
+    if not cmds.attributeQuery(_symmetry_map_attr, node=shape, exists=True):
+        cmds.addAttr(shape, ln=_symmetry_map_attr, dt='Int32Array')
+    if not cmds.attributeQuery(_symmetry_map_key_attr, node=shape, exists=True):
+        cmds.addAttr(shape, ln=_symmetry_map_key_attr, dt='string')
+
+    cmds.setAttr('%s.%s' % (shape, _symmetry_map_attr), indices.tolist(), type='Int32Array')
+    cmds.setAttr('%s.%s' % (shape, _symmetry_map_key_attr), key, type='string')
+
+def get_symmetry_map(shape, threshold=0.01, axis_of_symmetry='x', positive_to_negative=True,
+        plane_point=(0, 0, 0), plane_normal=None, local_space=False, store_on_mesh=False, progress=None):
+    """
+    Return a symmetry map for shape, using a cached map if possible.
+
+    This returns the indices array from make_vertex_symmetry_map_array.  The map is made
+    from the base mesh, as given by mesh_io.get_base_shape, so posing or deforming a
+    character doesn't change it.  Maps are cached for the session, keyed by the mesh's
+    topology, its base points and the options, so a map is only made again if the base
+    mesh or the options change.
+
+    If store_on_mesh is true, the map is also stored in an int array attribute on the
+    shape, so it's saved with the scene and reused in later sessions.
+    """
+    normal, point = symmetry_plane(axis_of_symmetry, plane_point, plane_normal)
+
+    shape = mesh_io.get_mesh_dag_path(shape).fullPathName()
+    counts, face_vertices = mesh_io.get_topology(shape)
+
+    # Use the base mesh's points, unless a deformer changes the vertex count.
+    vertices = mesh_io.get_points(mesh_io.get_base_shape(shape), world_space=not local_space)
+    if len(vertices) != mesh_io.get_mesh_fn(shape).numVertices:
+        vertices = mesh_io.get_points(shape, world_space=not local_space)
+    options = (float(threshold), normal.tolist(), point.tolist(), bool(positive_to_negative), bool(local_space))
+    key = _symmetry_map_key(vertices, counts, face_vertices, options)
+
+    uuid = cmds.ls(shape, uuid=True)[0]
+    cached = _symmetry_map_cache.get(uuid)
+    if cached is not None and cached[0] == key:
+        indices = cached[1]
+    else:
+        indices = _load_stored_symmetry_map(shape, key, len(vertices))
+        if indices is None:
+            indices, distances = symmetry_map_points(vertices, threshold, positive_to_negative=positive_to_negative,
+                    plane_point=point, plane_normal=normal, progress=progress)
+        _symmetry_map_cache[uuid] = (key, indices)
+
+    if store_on_mesh and _load_stored_symmetry_map(shape, key, len(vertices)) is None:
+        _store_symmetry_map(shape, key, indices)
+
+    # Return a copy, so callers can't modify the cached map.
+    return indices.copy()
+
+def clear_symmetry_map_cache():
+    """
+    Discard symmetry maps cached this session.  Maps stored on meshes aren't affected.
+    """
+    _symmetry_map_cache.clear()
+
+def make_topological_symmetry_map(shape, seam_edge):
+    """
+    Make symmetry maps for shape from its topology.
+
+    seam_edge is the index of an edge on the plane of symmetry.  Unlike
+    make_vertex_symmetry_map, vertex positions are ignored, so this works on posed or
+    sculpted meshes.
+
+    Return (vertex_map, edge_map, face_map), as with topological_symmetry.make_symmetry_map.
+    """
+    counts, face_vertices = mesh_io.get_topology(shape)
+    edges = mesh_io.get_edges(shape)
+    vertex_count = mesh_io.get_mesh_fn(shape).numVertices
+    return topological_symmetry.make_symmetry_map(counts, face_vertices, edges[seam_edge],
+            edges=edges, vertex_count=vertex_count)
+
+def make_subdivision_map(base_shape, subdivided_shape, seed):
+    """
+    Map base_shape to subdivided_shape, a mesh subdivided from it once.
+
+    seed is ((v, w), (sv, se)), as with subdivision_mapping.make_subdivision_map.  Vertex
+    positions are ignored, so this works however far the subdivided mesh has been sculpted.
+
+    Return a subdivision_mapping.SubdivisionMap.  Edge indices refer to base_shape's edges.
+    """
+    base_counts, base_face_vertices = mesh_io.get_topology(base_shape)
+    subdivided_counts, subdivided_face_vertices = mesh_io.get_topology(subdivided_shape)
+    return subdivision_mapping.make_subdivision_map(base_counts, base_face_vertices,
+            subdivided_counts, subdivided_face_vertices, seed, base_edges=mesh_io.get_edges(base_shape))
+
+def make_topological_vertex_map(src_shape, dst_shape, seed_faces, seed_vertices):
+    """
+    Map src_shape to dst_shape, a mesh with the same topology, from their connectivity.
+
+    seed_faces is a (src_face, dst_face) pair of face indices that correspond, and
+    seed_vertices is a (src_vertex, dst_vertex) pair of vertices of those faces that
+    correspond.  Vertex positions are ignored, so this works when the vertex order has
+    been scrambled and the shape has changed.
+
+    Return (vertex_map, face_map, corner_map), as with topological_mapping.make_topology_map.
+    """
+    src_counts, src_face_vertices = mesh_io.get_topology(src_shape)
+    dst_counts, dst_face_vertices = mesh_io.get_topology(dst_shape)
+    return topological_mapping.make_topology_map(src_counts, src_face_vertices, dst_counts, dst_face_vertices,
+            seed_faces, seed_vertices)
+
+def _iter_map_chunks(dst_vertices, search, radius, chunk_size):
+    for start in range(0, len(dst_vertices), chunk_size):
+        end = min(start + chunk_size, len(dst_vertices))
+        src_indices, distances = search.query_within(dst_vertices[start:end], radius)
+        yield np.arange(start, end), src_indices, np.sqrt(distances).astype(np.float32)
+
+def iter_map_points(src_vertices, dst_vertices, threshold=0.01, chunk_size=default_chunk_size):
+    """
+    Make a vertex map between two (N, 3) arrays of points a chunk at a time.
+
+    This yields (dst_indices, src_indices, distances) for each chunk of up to chunk_size
+    destination vertices.  This can be used to keep a UI responsive while mapping.
+    """
+    dst_vertices = np.asarray(dst_vertices, dtype=np.float64).reshape(-1, 3)
+
+    radius = _match_radius(threshold)
+    search = _radius_search(src_vertices, radius)
+    for chunk in _iter_map_chunks(dst_vertices, search, radius, chunk_size):
+        yield chunk
+
+def map_points(src_vertices, dst_vertices, threshold=0.01, progress=None):
+    """
+    Make a vertex map between two (N, 3) arrays of points.
+
+    This is make_vertex_map_array for points that have already been read.
+    """
+    dst_vertices = np.asarray(dst_vertices, dtype=np.float64).reshape(-1, 3)
+
+    radius = _match_radius(threshold)
+    search = _radius_search(src_vertices, radius, progress=progress)
+    chunks = _iter_map_chunks(dst_vertices, search, radius, default_chunk_size)
+
+    index_mapping = np.full(len(dst_vertices), -1, dtype=np.int32)
+    index_distances = np.full(len(dst_vertices), np.inf, dtype=np.float32)
+    return _collect_chunks(chunks, len(dst_vertices), index_mapping, index_distances, progress)
+
+def make_vertex_map_array(src_shape, dst_shape, threshold=0.01, progress=None):
+    """
+    Given two shape, make a mapping from vertices on the first shape to matching vertices
+    on the second shape.
+
+    Return (indices, distances), an int32 array of the source vertex for each destination
+    vertex and a float32 array of the distance to it.  Unmatched vertices have an index of
+    -1 and an infinite distance.
+
+    progress is as with make_vertex_symmetry_map_array.
+    """
+    return map_points(mesh_io.get_points(src_shape), mesh_io.get_points(dst_shape), threshold, progress)
+
+def match_points_one_to_one(src_vertices, dst_vertices, threshold=0.01, candidates=8):
+    """
+    Make a one-to-one vertex map between two (N, 3) arrays of points.
+
+    Unlike map_points, each source vertex is used by at most one destination vertex.
+    The nearest few source vertices within the threshold are found for each destination
+    vertex, and all of these pairs are assigned greedily from the closest, skipping pairs
+    whose source or destination is already taken.
+
+    candidates is the number of source vertices considered for each destination.  A
+    destination vertex whose candidates are all taken by closer pairs is unmatched.
+
+    Return (indices, distances, conflicts).  indices and distances are as with
+    map_points.  conflicts is an array of the destination vertices that didn't get
+    their nearest source vertex because a closer destination vertex took it.
+    """
+    src_vertices = np.asarray(src_vertices, dtype=np.float64).reshape(-1, 3)
+    dst_vertices = np.asarray(dst_vertices, dtype=np.float64).reshape(-1, 3)
+
+    index_mapping = np.full(len(dst_vertices), -1, dtype=np.int32)
+    index_distances = np.full(len(dst_vertices), np.inf, dtype=np.float32)
+    if not len(src_vertices) or not len(dst_vertices):
+        return index_mapping, index_distances, np.zeros(0, dtype=np.int32)
+
+    # Find candidate pairs.  As elsewhere in this module, the threshold is compared against
+    # squared distances.
+    tree = _make_tree(src_vertices)
+    src_indices, distances = tree.query(dst_vertices, k=min(candidates, len(src_vertices)),
+            max_distance=_match_radius(threshold))
+    src_indices = src_indices.reshape(len(dst_vertices), -1)
+    distances = distances.reshape(len(dst_vertices), -1)
+    nearest_src = np.where(distances[:, 0] <= threshold, src_indices[:, 0], -1)
+
+    dst_indices = np.repeat(np.arange(len(dst_vertices)), src_indices.shape[1])
+    src_indices = src_indices.ravel()
+    distances = distances.ravel()
+    in_range = (src_indices >= 0) & (distances <= threshold)
+    dst_indices, src_indices, distances = dst_indices[in_range], src_indices[in_range], distances[in_range]
+
+    # Assign pairs from closest to farthest.  Ties are broken by destination index, so
+    # the result doesn't depend on the sort.
+    order = np.lexsort((dst_indices, distances))
+    src_taken = np.zeros(len(src_vertices), dtype=bool).tolist()
+    dst_taken = np.zeros(len(dst_vertices), dtype=bool).tolist()
+    assigned = []
+    for pair, dst_idx, src_idx in zip(order.tolist(), dst_indices[order].tolist(), src_indices[order].tolist()):
+        if dst_taken[dst_idx] or src_taken[src_idx]:
+            continue
+        dst_taken[dst_idx] = True
+        src_taken[src_idx] = True
+        assigned.append(pair)
+
+    assigned = np.array(assigned, dtype=np.int64)
+    index_mapping[dst_indices[assigned]] = src_indices[assigned]
+    index_distances[dst_indices[assigned]] = np.sqrt(distances[assigned])
+
+    conflicts = np.flatnonzero((nearest_src != -1) & (index_mapping != nearest_src)).astype(np.int32)
+    return index_mapping, index_distances, conflicts
+
+def make_vertex_map_one_to_one_array(src_shape, dst_shape, threshold=0.01, candidates=8):
+    """
+    Given two shapes, make a one-to-one mapping from vertices on the first shape to
+    matching vertices on the second shape.
+
+    Return (indices, distances, conflicts), as with match_points_one_to_one.
+    """
+    return match_points_one_to_one(mesh_io.get_points(src_shape), mesh_io.get_points(dst_shape),
+            threshold, candidates)
+
+def iter_vertex_map_array(src_shape, dst_shape, threshold=0.01, chunk_size=default_chunk_size):
+    """
+    Map the vertices of dst_shape to src_shape a chunk at a time, as with iter_map_points.
+    """
+    return iter_map_points(mesh_io.get_points(src_shape), mesh_io.get_points(dst_shape), threshold, chunk_size)
+
+def iter_vertex_symmetry_map_array(shape, threshold=0.01, axis_of_symmetry='x', positive_to_negative=True,
+        plane_point=(0, 0, 0), plane_normal=None, local_space=False, chunk_size=default_chunk_size):
+    """
+    Make a symmetry map for shape a chunk at a time, as with iter_symmetry_map_points.
+    """
+    vertices = mesh_io.get_points(shape, world_space=not local_space)
+    return iter_symmetry_map_points(vertices, threshold, axis_of_symmetry, positive_to_negative,
+            plane_point, plane_normal, chunk_size)
+
+# The source grid or tree in map_points_to_many worker processes.
+_worker_grid = None
+
+def _init_map_worker(grid):
+    global _worker_grid
+    _worker_grid = grid
+
+def _map_worker(args):
+    dst_vertices, radius = args
+    src_indices, distances = _worker_grid.query_within(dst_vertices, radius)
+    return src_indices, np.sqrt(distances).astype(np.float32)
+
+def map_points_to_many(src_vertices, dst_vertices_list, threshold=0.01, processes=0):
+    """
+    Map each of a list of destination point arrays against one source point array.
+
+    The source search structure is only built once.  If processes is greater than zero, the
+    destinations are mapped in a pool of that many processes, and if the source needs a
+    tree, it's built with kdtree.ArrayKDTree.build_parallel.  Inside Maya,
+    multiprocessing needs to be pointed at mayapy with multiprocessing.set_executable
+    first, or the workers will be started as new copies of Maya.
+
+    Return a list of (indices, distances) for each destination, as with map_points.
+    """
+    radius = _match_radius(threshold)
+    src_grid = _radius_search(src_vertices, radius, processes=processes)
+
+    if processes <= 0 or len(dst_vertices_list) < 2:
+        results = []
+        for dst_vertices in dst_vertices_list:
+            src_indices, distances = src_grid.query_within(dst_vertices, radius)
+            results.append((src_indices, np.sqrt(distances).astype(np.float32)))
+        return results
+
+    # Send the grid to each worker once, rather than with every destination.
+    pool = multiprocessing.Pool(min(processes, len(dst_vertices_list)), initializer=_init_map_worker, initargs=(src_grid,))
+    try:
+        return pool.map(_map_worker, [(dst_vertices, radius) for dst_vertices in dst_vertices_list])
+    finally:
+        pool.close()
+        pool.join()
+
+def make_vertex_maps_array(src_shape, dst_shapes, threshold=0.01, processes=0):
+    """
+    Map the vertices of each of a list of shapes against one source shape.
+
+    This is faster than calling make_vertex_map_array for each shape, since the source
+    is only indexed once.  processes is as with map_points_to_many.
+
+    Return a list of (indices, distances) for each shape in dst_shapes, as with
+    make_vertex_map_array.
+    """
+    dst_vertices_list = [mesh_io.get_points(dst_shape) for dst_shape in dst_shapes]
+    return map_points_to_many(mesh_io.get_points(src_shape), dst_vertices_list, threshold, processes)
+
+def make_surface_map_array(src_shape, dst_shape, progress=None):
+    """
+    Map each vertex on dst_shape to the closest point on the surface of src_shape.
+
+    Unlike make_vertex_map, this doesn't snap to source vertices, so it works between
+    meshes with different topology.
+
+    Return (faces, triangle_vertices, weights, distances), as with
+    triangle_bvh.TriangleBVH.query.  Per-vertex values on the source can be sampled with
+    triangle_bvh.interpolate(values, triangle_vertices, weights).
+
+    progress is as with make_vertex_symmetry_map_array.
+    """
+    triangles, faces = mesh_io.get_triangles(src_shape)
+    bvh = triangle_bvh.TriangleBVH(mesh_io.get_points(src_shape), triangles, faces)
+    dst_vertices = mesh_io.get_points(dst_shape)
+
+    results = []
+    for start in range(0, len(dst_vertices), default_chunk_size):
+        results.append(bvh.query(dst_vertices[start:start+default_chunk_size]))
+        if progress is not None:
+            done = min(start + default_chunk_size, len(dst_vertices))
+            progress.set_task_progress('Mapping vertices', percent=float(done) / len(dst_vertices))
+
+    if not results:
+        return bvh.query(dst_vertices)
+    return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+def make_vertex_map(src_shape, dst_shape, threshold=0.01, progress=None):
     """
     Given two shape, make a mapping from vertices on the first shape to matching vertices
     on the second shape.  Unmatched vertices will be mapped to -1.
     
     Return a map of {dst: src} vertex indices and a list of vertices that weren't matched.
     """
-    shapes = (src_shape, dst_shape)
-    shape_vertices = []
-    for shape in shapes:
-        vertices = cmds.xform('%s.vtx[*]' % shape, q=True, ws=True, t=True)
-        vertices = [(x, y, z) for x, y, z in zip(vertices[0::3], vertices[1::3], vertices[2::3])]
-        vertices = [PointWithIndex(vtx, idx) for idx, vtx in enumerate(vertices)]
-        shape_vertices.append(vertices)
-
-    # Make a tree of the vertex positions in the first (source) shape.
-    src_tree = kdtree.create(shape_vertices[0])
+    src_indices, distances = make_vertex_map_array(src_shape, dst_shape, threshold, progress)
 
     index_mapping = {}
     unmapped_dst_vertices = set()
-    for dst_vtx in shape_vertices[1]:
-        node, distance = src_tree.search_nn(dst_vtx)
-
-        src_idx = node.data.idx
-        dst_idx = dst_vtx.idx
-        if distance > threshold:
+    for dst_idx, src_idx in enumerate(src_indices.tolist()):
+        if src_idx == -1:
             # We don't have a match.  Remember that this vertex was unmatched.
             unmapped_dst_vertices.add(dst_idx)
             index_mapping[dst_idx] = -1
@@ -96,5 +576,3 @@ def make_vertex_map(src_shape, dst_shape, threshold=0.01):
             index_mapping[dst_idx] = src_idx
             
     return index_mapping, unmapped_dst_vertices
-    
-